@@ -2,12 +2,18 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_wtf.csrf import CSRFProtect
+from .jobs import AnalysisQueue
+from .scraper import ProductSearch
 
 # Initialize extensions
 db = SQLAlchemy()
 login_manager = LoginManager()
+csrf = CSRFProtect()
+analysis_queue = AnalysisQueue()
+product_search = ProductSearch()
 
-def create_app():
+def create_app(test_config=None):
     """Create and configure the Flask application."""
     app = Flask(__name__, instance_relative_config=True)
 
@@ -16,36 +22,55 @@ def create_app():
         SECRET_KEY='dev', # Replace with a real secret key in production
         SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(app.instance_path, 'lookcircuit.sqlite'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
-        UPLOAD_FOLDER=os.path.join(app.root_path, 'static/uploads')
+        UPLOAD_FOLDER=os.path.join(app.root_path, 'static/uploads'),
+        MAX_CONTENT_LENGTH=16 * 1024 * 1024, # Requests above this are rejected with 413
+        MAX_IMAGE_PIXELS=40_000_000, # Largest accepted upload, checked from the header before decoding
+        DETECTION_MAX_DIM=800, # Working resolution for face detection, None for full size
+        THUMBNAIL_MAX_AGE=365 * 24 * 3600, # Thumbnail URLs are content-addressed, so they can be cached for good
+        # Import OpenCV and parse the face cascade in create_app instead of on the
+        # first analysis. Meant for a server that loads the app once before forking
+        # its workers (gunicorn --preload), so they share one copy
+        PRELOAD_ANALYSIS=False,
+        PAGE_CACHE_ENABLED=True, # Serve unchanged pages from memory with ETags, see pagecache.py
     )
-
-    # Ensure the instance folder exists
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
-
-    # Ensure the upload folder exists
-    try:
-        os.makedirs(app.config['UPLOAD_FOLDER'])
-    except OSError:
-        pass
+    # Products that recommendations link to, one JSON object per line; see catalog.py
+    app.config.setdefault('PRODUCT_CATALOG', os.path.join(app.instance_path, 'product_catalog.jsonl'))
+    # Built from the catalogue by `flask similarity build`; see similarity.py
+    app.config.setdefault('SIMILARITY_INDEX', os.path.join(app.instance_path, 'similarity_index'))
+    if test_config is not None:
+        # Overrides for tests and benchmarks
+        app.config.from_mapping(test_config)
 
     # Initialize extensions with the app
+    from . import database
+    database.configure(app)
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login' # We will create an 'auth' blueprint
+    # Every POST needs a token; forms outside FlaskForm add {{ csrf_token() }}
+    csrf.init_app(app)
+    analysis_queue.init_app(app)
+    product_search.init_app(app)
 
     # Import models so that they are registered with SQLAlchemy
     from . import models
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return models.User.query.get(int(user_id))
+    # Cached between requests, see identity.py
+    from .identity import load_user
+    login_manager.user_loader(load_user)
+
+    # Connection pragmas; tables and indexes are created by `flask init-db`
+    database.init_app(app, db)
 
-    # Create database tables if they don't exist
-    with app.app_context():
-        db.create_all()
+    # OpenCV is otherwise imported by the first analysis that needs it
+    if app.config['PRELOAD_ANALYSIS']:
+        from . import analysis, detectors
+        detectors.warm_up()
+        app.logger.info('Face detectors ready: %s', detectors.detector_stats())
+
+    # Compile the recommendation data before the first request needs it
+    from .recommender import get_recommendation_index
+    get_recommendation_index()
 
     # Register blueprints
     from .auth import auth as auth_blueprint
@@ -54,4 +79,14 @@ def create_app():
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    # Request, query and template timings plus the /metrics endpoint
+    from . import metrics
+    metrics.init_app(app, db)
+
+    # Register CLI commands
+    from .cli import analysis_cli, similarity_cli, init_db_command
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(analysis_cli)
+    app.cli.add_command(similarity_cli)
+
     return app
@@ -1,47 +1,138 @@
+import time
+
 import cv2
 import numpy as np
 
-# --- Face Shape Detection Logic ---
+from .detectors import FRONTAL_FACE, get_pool
 
-def detect_face_shape(image_path):
-    """Detect face shape using advanced facial analysis with multiple methods"""
-    try:
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"Could not load image: {image_path}")
-            return "Unknown"
+# A change to the pipeline that can change its results must bump
+# jobs.ANALYZER_VERSION, so analyses cached under the previous version are
+# not reused.
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        face_data = detect_face_with_multiple_methods(img, gray)
+# Longest side, in pixels, of the image that face detection runs on. Faces only
+# need a few hundred pixels to be found, so bigger uploads are shrunk first and
+# the detected rectangle is mapped back to full resolution. None disables it.
+DETECTION_MAX_DIM = 800
 
-        if face_data is None:
-            print("No face detected in image")
-            return "Unknown"
+# --- Analysis Pipeline ---
 
-        x, y, w, h = face_data
-        face_shape = classify_face_shape_from_geometry(w, h)
-        return face_shape
+def analyze_image(image_path, detection_max_dim=DETECTION_MAX_DIM):
+    """
+    Run the full analysis pipeline on an uploaded photo.
 
+    The image is decoded once, converted to grayscale once and face detection
+    runs once. The resulting face rectangle is handed to every analyzer in
+    ANALYZERS, so face shape, skin tone and anything added later all look at
+    the same face.
+
+    Args:
+        image_path (str): Path of the image on disk.
+        detection_max_dim (int): Working resolution for face detection, see
+            DETECTION_MAX_DIM.
+
+    Returns:
+        dict: ``face_shape``, ``skin_tone``, the sampled ``skin_rgb`` and any
+        other analyzer results, the detected ``face`` as an ``(x, y, w, h)``
+        tuple (or None) and ``timings`` with the seconds spent in each stage.
+    """
+    timings = {}
+    result = dict(RESULT_DEFAULTS)
+    result['face'] = None
+    result['timings'] = timings
+
+    started = time.perf_counter()
+    img = cv2.imread(image_path)
+    timings['decode'] = time.perf_counter() - started
+    if img is None:
+        print(f"Could not load image: {image_path}")
+        return result
+
+    started = time.perf_counter()
+    try:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        face_data = detect_face_with_multiple_methods(img, gray, detection_max_dim)
     except Exception as e:
-        print(f"Error in face shape detection: {e}")
-        return "Unknown"
+        print(f"Error in face detection: {e}")
+        face_data = None
+    timings['detect'] = time.perf_counter() - started
+    if face_data is None:
+        print("No face detected in image")
+    else:
+        face_data = tuple(int(v) for v in face_data)
+        result['face'] = face_data
+
+    for name, analyzer in ANALYZERS:
+        started = time.perf_counter()
+        try:
+            result.update(analyzer(img, face_data))
+        except Exception as e:
+            print(f"Error in {name} analysis: {e}")
+        timings[name] = time.perf_counter() - started
+
+    return result
 
-def detect_face_with_multiple_methods(img, gray):
-    """Try multiple face detection methods for better accuracy"""
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# --- Face Shape Detection Logic ---
+
+def detect_face_shape(image_path):
+    """Detect face shape using advanced facial analysis with multiple methods"""
+    return analyze_image(image_path)['face_shape']
+
+def detect_face_with_multiple_methods(img, gray, max_dim=None):
+    """
+    Try multiple face detection methods for better accuracy.
+
+    When `max_dim` is set and the image is larger, detection runs on a copy
+    of `gray` shrunk so its longest side is `max_dim`, and the face is mapped
+    back to full-resolution coordinates. The minimum face sizes below apply to
+    the working image, so tiny background faces in a huge photo are skipped
+    rather than searched for at great cost.
+    """
     detection_params = [
         {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (80, 80)},
         {'scaleFactor': 1.2, 'minNeighbors': 4, 'minSize': (60, 60)},
         {'scaleFactor': 1.3, 'minNeighbors': 3, 'minSize': (40, 40)},
     ]
 
-    for params in detection_params:
-        faces = face_cascade.detectMultiScale(gray, **params)
-        if len(faces) > 0:
-            return max(faces, key=lambda rect: rect[2] * rect[3]) # Return largest face
+    small, scale = downscale_for_detection(gray, max_dim)
+
+    with get_pool(FRONTAL_FACE).acquire() as face_cascade:
+        for params in detection_params:
+            faces = face_cascade.detectMultiScale(small, **params)
+            if len(faces) > 0:
+                face = max(faces, key=lambda rect: rect[2] * rect[3]) # Return largest face
+                return map_rect_to_full_resolution(face, scale, gray.shape)
 
     return None
 
+def downscale_for_detection(gray, max_dim):
+    """Shrink `gray` so its longest side is at most `max_dim`; returns (image, scale)."""
+    height, width = gray.shape[:2]
+    longest = max(height, width)
+    if not max_dim or longest <= max_dim:
+        return gray, 1.0
+
+    scale = max_dim / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), scale
+
+def map_rect_to_full_resolution(rect, scale, shape):
+    """Map an (x, y, w, h) rectangle found at `scale` back onto an image of `shape`."""
+    x, y, w, h = (int(v) for v in rect)
+    if scale == 1.0:
+        return x, y, w, h
+
+    height, width = shape[:2]
+    x, y = min(round(x / scale), width - 1), min(round(y / scale), height - 1)
+    w, h = min(round(w / scale), width - x), min(round(h / scale), height - y)
+    return x, y, w, h
+
+def face_shape_analyzer(img, face):
+    """Face shape analyzer for the pipeline."""
+    if face is None:
+        return {}
+    x, y, w, h = face
+    return {'face_shape': classify_face_shape_from_geometry(w, h)}
+
 def classify_face_shape_from_geometry(w, h):
     """
     Simplified classification based on the width-to-height ratio of the face.
@@ -64,42 +155,161 @@ def classify_face_shape_from_geometry(w, h):
 
 def analyze_skin_tone(image_path):
     """Analyze skin tone from image"""
-    try:
-        img = cv2.imread(image_path)
-        if img is None: return "Unknown"
+    return analyze_image(image_path)['skin_tone']
 
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+def skin_tone_analyzer(img, face):
+    """Skin tone analyzer for the pipeline, sampling the centre of the face."""
+    skin_rgb = sample_skin_rgb(img, face)
+    if skin_rgb is None:
+        return {}
+    return {'skin_rgb': skin_rgb, 'skin_tone': str(classify_skin_tones([skin_rgb])[0])}
 
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+def sample_skin_rgb(img, face):
+    """Average RGB colour of the central region of the face, or None."""
+    if face is None:
+        return None
 
-        if len(faces) == 0:
-            return "Unknown"
+    x, y, w, h = face
+    # Select a smaller, central region of the face to avoid hair/shadows
+    face_center_x, face_center_y = x + w // 2, y + h // 2
+    roi_w, roi_h = w // 4, h // 4
+    roi_x, roi_y = face_center_x - roi_w // 2, face_center_y - roi_h // 2
 
-        x, y, w, h = faces[0]
-        # Select a smaller, central region of the face to avoid hair/shadows
-        face_center_x, face_center_y = x + w // 2, y + h // 2
-        roi_w, roi_h = w // 4, h // 4
-        roi_x, roi_y = face_center_x - roi_w // 2, face_center_y - roi_h // 2
+    # Only the ROI is needed in RGB, so average in BGR and flip the result
+    # instead of converting the whole image.
+    face_roi = img[roi_y : roi_y + roi_h, roi_x : roi_x + roi_w]
 
-        face_roi = img_rgb[roi_y : roi_y + roi_h, roi_x : roi_x + roi_w]
+    if face_roi.size == 0: return None
 
-        if face_roi.size == 0: return "Unknown"
+    b, g, r = np.mean(face_roi.reshape(-1, 3), axis=0)
+    return [float(r), float(g), float(b)]
 
-        avg_color = np.mean(face_roi.reshape(-1, 3), axis=0)
-        r, g, b = avg_color
+# Simple skin tone classification based on average RGB: the first tone whose
+# minimum R, G and B are all exceeded wins, anything darker is "Deep".
+SKIN_TONE_THRESHOLDS = [
+    ("Fair", (200, 180, 170)),
+    ("Medium", (160, 120, 100)),
+    ("Olive", (120, 80, 60)),
+]
 
-        # Simple skin tone classification based on average RGB
-        if r > 200 and g > 180 and b > 170:
-            return "Fair"
-        elif r > 160 and g > 120 and b > 100:
-            return "Medium"
-        elif r > 120 and g > 80 and b > 60:
-            return "Olive"
-        else:
-            return "Deep"
+def classify_skin_tones(rgb):
+    """
+    Classify many average skin colours at once.
 
-    except Exception as e:
-        print(f"Error in skin tone analysis: {e}")
-        return "Unknown"
+    Args:
+        rgb (array-like): An (n, 3) array of average R, G, B values.
+
+    Returns:
+        numpy.ndarray: The n skin tone names.
+    """
+    rgb = np.asarray(rgb, dtype=np.float64).reshape(-1, 3)
+    conditions = [np.all(rgb > minimum, axis=1) for _, minimum in SKIN_TONE_THRESHOLDS]
+    return np.select(conditions, [name for name, _ in SKIN_TONE_THRESHOLDS], default="Deep")
+
+# --- Dominant Colour Logic ---
+
+# Palette extraction settings. Pixels are sampled on a regular grid down to
+# about PALETTE_SAMPLE_PIXELS, quantized to PALETTE_QUANT_BITS per channel and
+# binned; k-means then runs over the occupied bins rather than the pixels, for
+# at most PALETTE_MAX_ITERATIONS rounds or until PALETTE_TIME_BUDGET seconds
+# have passed. benchmarks/bench_palette.py compares these settings.
+PALETTE_SIZE = 5
+PALETTE_SAMPLE_PIXELS = 16384
+PALETTE_QUANT_BITS = 4
+PALETTE_MAX_ITERATIONS = 8
+PALETTE_TIME_BUDGET = 0.010
+
+def dominant_colors_analyzer(img, face):
+    """Dominant colour analyzer for the pipeline; looks at the whole photo."""
+    return {'dominant_colors': extract_dominant_colors(img)}
+
+def extract_dominant_colors(img, k=PALETTE_SIZE, max_pixels=PALETTE_SAMPLE_PIXELS,
+                            bits=PALETTE_QUANT_BITS, max_iterations=PALETTE_MAX_ITERATIONS,
+                            time_budget=PALETTE_TIME_BUDGET):
+    """
+    Find the main colours of a BGR image.
+
+    Args:
+        img (numpy.ndarray): The decoded BGR image.
+        k (int): Number of colours to return at most.
+        max_pixels (int): Roughly how many pixels are sampled.
+        bits (int): Bits per channel kept when binning the samples.
+        max_iterations (int): Upper bound on k-means refinement rounds.
+        time_budget (float): Seconds after which refinement stops early.
+
+    Returns:
+        list: Up to `k` dicts with the colour as ``hex`` (``#rrggbb``) and the
+        ``ratio`` of sampled pixels closest to it, largest share first.
+    """
+    started = time.perf_counter()
+    height, width = img.shape[:2]
+    step = max(1, int(np.sqrt(height * width / max_pixels)))
+    pixels = img[::step, ::step].reshape(-1, 3)
+    if pixels.size == 0:
+        return []
+
+    # Bin the samples: one code per quantized colour, with the mean colour of
+    # each occupied bin as the point k-means works on.
+    quantized = (pixels >> (8 - bits)).astype(np.int32)
+    codes = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+    counts = np.bincount(codes, minlength=1 << (3 * bits))
+    occupied = np.flatnonzero(counts)
+    weights = counts[occupied].astype(np.float64)
+    points = np.stack([
+        np.bincount(codes, weights=pixels[:, channel], minlength=counts.size)[occupied]
+        for channel in range(3)
+    ], axis=1) / weights[:, None]
+
+    # Seed with the biggest bin, then repeatedly with the bin that is both
+    # common and far from every seed so far.
+    k = min(k, len(points))
+    seeds = [int(np.argmax(weights))]
+    nearest = ((points - points[seeds[0]]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        candidate = int(np.argmax(weights * nearest))
+        if nearest[candidate] == 0:
+            break
+        seeds.append(candidate)
+        nearest = np.minimum(nearest, ((points - points[candidate]) ** 2).sum(axis=1))
+    centres = points[seeds]
+
+    for _ in range(max_iterations):
+        labels = ((points[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        totals = np.bincount(labels, weights=weights, minlength=len(centres))
+        moved = np.stack([
+            np.bincount(labels, weights=weights * points[:, channel], minlength=len(centres))
+            for channel in range(3)
+        ], axis=1)
+        keep = totals > 0
+        updated = centres.copy()
+        updated[keep] = moved[keep] / totals[keep, None]
+        converged = np.allclose(updated, centres, atol=0.5)
+        centres = updated
+        if converged or time.perf_counter() - started > time_budget:
+            break
+
+    labels = ((points[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    totals = np.bincount(labels, weights=weights, minlength=len(centres))
+    palette = []
+    for i in np.argsort(-totals):
+        if totals[i] == 0:
+            continue
+        b, g, r = (int(round(v)) for v in np.clip(centres[i], 0, 255))
+        palette.append({'hex': f'#{r:02x}{g:02x}{b:02x}', 'ratio': round(float(totals[i] / weights.sum()), 4)})
+    return palette
+
+# Analyzers run by analyze_image, in order. Each takes the decoded BGR image
+# and the detected face rectangle (or None) and returns a dict of result
+# fields; fields it leaves out keep their RESULT_DEFAULTS value.
+ANALYZERS = [
+    ('face_shape', face_shape_analyzer),
+    ('skin_tone', skin_tone_analyzer),
+    ('dominant_colors', dominant_colors_analyzer),
+]
+
+RESULT_DEFAULTS = {
+    'face_shape': "Unknown",
+    'skin_tone': "Unknown",
+    'skin_rgb': None,
+    'dominant_colors': None,
+}
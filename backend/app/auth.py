@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, url_for, flash, redirect
 from .forms import RegistrationForm, LoginForm
 from .models import User
 from . import db
+from .identity import invalidate_user
 from flask_login import login_user, logout_user, current_user, login_required
 
 auth = Blueprint('auth', __name__)
@@ -40,5 +41,6 @@ def login():
 @auth.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
     return redirect(url_for('main.index')) # Will create main blueprint later
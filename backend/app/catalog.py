@@ -0,0 +1,335 @@
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from bisect import insort
+from collections import defaultdict
+
+CATALOG_FILENAME = 'product_catalog.jsonl'
+
+# How often, in seconds, the catalogue file is checked for changes.
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Products shown for each recommended item.
+MATCHES_PER_ITEM = 3
+
+STOPWORDS = frozenset(
+    'a an and are as at be by for from in into is it of on or that the their this to with you your'.split()
+)
+_WORD = re.compile(r'[a-z0-9]+')
+# Shared by every CatalogIndex, so a rebuilt index never reuses a version
+_versions = itertools.count(1)
+_CONSIDER_IN = re.compile(r'^(.*?) \(consider in (.+)\)$')
+
+
+def stem(word):
+    """Strip plural endings, so "dresses" and "dress" index the same."""
+    if len(word) > 4 and word.endswith(('sses', 'shes', 'ches', 'xes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """The index terms of a piece of free text, in order of appearance."""
+    return [stem(word) for word in _WORD.findall((text or '').lower()) if word not in STOPWORDS]
+
+
+def split_recommendation_item(text):
+    """Split "Fitted tops (consider in navy)" into ("Fitted tops", "navy")."""
+    match = _CONSIDER_IN.match(text)
+    return (match.group(1), match.group(2)) if match else (text, None)
+
+
+def _facet(kind, value):
+    return f'{kind}:{value.strip().lower()}'
+
+
+class CatalogIndex:
+    """
+    Inverted index over a product catalogue.
+
+    Words from each product's name and category map to the ids of the
+    products containing them, and colours, style tags and the category are
+    indexed as facets. Each word's posting list is also kept as a tuple
+    ordered best product first (by `popularity`), so a lookup walks the
+    shortest list of the words it needs and stops as soon as it has enough
+    matches instead of scoring every candidate.
+
+    The catalogue file holds one JSON product per line. Lines appended to it
+    are applied as updates: a line with a known id replaces that product and
+    {"id": ..., "deleted": true} removes it. Updates only rebuild the posting
+    lists of the affected terms, but do so in new copies of the lookup
+    tables and then swap all of them in with one assignment. A lookup takes
+    the tables once when it starts, so lookups running at the same time
+    never see an update half-applied.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.version = 0
+        # (products, postings, ordered postings, style filter cache), only
+        # ever replaced as a whole, see update()
+        self._state = ({}, {}, {}, {})
+        # Terms of each product, only used by update() under the lock
+        self._terms = {}
+        self._lock = threading.Lock()
+        # Where the file has been read up to, see apply_file_changes()
+        self._offset = 0
+        self._tail = b''
+        self._file_state = None
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def get(self, product_id):
+        return self._state[0].get(product_id)
+
+    def products(self):
+        """Every product, in no particular order."""
+        return list(self._state[0].values())
+
+    @staticmethod
+    def product_terms(product):
+        terms = set(tokenize(product.get('name', '')))
+        terms.update(tokenize(product.get('category', '')))
+        for color in product.get('colors', ()):
+            terms.add(_facet('color', color))
+        for style in product.get('style_tags', ()):
+            terms.add(_facet('style', style))
+        if product.get('category'):
+            terms.add(_facet('category', stem(product['category'].strip().lower())))
+        return frozenset(terms)
+
+    def update(self, upserts=(), deletes=()):
+        """
+        Add or replace the products in `upserts` and remove the ids in
+        `deletes`, in one step.
+        """
+        with self._lock:
+            old_products, old_postings, old_ordered, _ = self._state
+            products = dict(old_products)
+            added = defaultdict(set)
+            removed = defaultdict(set)
+            for product_id in deletes:
+                if products.pop(product_id, None) is not None:
+                    for term in self._terms.pop(product_id):
+                        removed[term].add(product_id)
+            for product in upserts:
+                product_id = product['id']
+                old_terms = self._terms.get(product_id, frozenset())
+                new_terms = self.product_terms(product)
+                # The product's rank may have changed, so it is re-placed in
+                # every list it stays in
+                for term in old_terms:
+                    removed[term].add(product_id)
+                for term in new_terms:
+                    added[term].add(product_id)
+                products[product_id] = product
+                self._terms[product_id] = new_terms
+
+            postings = dict(old_postings)
+            ordered = dict(old_ordered)
+
+            def rank_key(product_id):
+                return (-products[product_id].get('popularity', 0), product_id)
+
+            for term in added.keys() | removed.keys():
+                self._replace_posting(postings, ordered, rank_key, term,
+                                      added.get(term, set()), removed.get(term, set()))
+            self._state = (products, postings, ordered, {})
+            self.version = next(_versions)
+
+    @staticmethod
+    def _replace_posting(postings, ordered, rank_key, term, added, removed):
+        ids = (postings.get(term, frozenset()) - removed) | added
+        if not ids:
+            postings.pop(term, None)
+            ordered.pop(term, None)
+            return
+        postings[term] = frozenset(ids)
+        if ':' in term:
+            # Facets are only used as filters and need no order
+            return
+        old_order = ordered.get(term, ())
+        if len(added) > len(old_order) // 8:
+            ordered[term] = tuple(sorted(ids, key=rank_key))
+        else:
+            order = [product_id for product_id in old_order if product_id not in removed]
+            for product_id in added:
+                insort(order, product_id, key=rank_key)
+            ordered[term] = tuple(order)
+
+    @staticmethod
+    def _style_filter(postings, style_filters, styles):
+        """Ids of the products tagged with any of `styles`, cached per style set."""
+        styles = tuple(styles)
+        ids = style_filters.get(styles)
+        if ids is None:
+            ids = frozenset().union(*(postings.get(_facet('style', s), ()) for s in styles))
+            style_filters[styles] = ids
+        return ids
+
+    def match(self, text, color=None, styles=None, category=None, limit=MATCHES_PER_ITEM):
+        """
+        The best products for a free-text description.
+
+        Products must contain every word of `text` that appears anywhere in
+        the catalogue; if fewer than `limit` do, the rarest words are dropped
+        one at a time until enough match. Products in `color` come first.
+
+        Args:
+            text (str): What to look for, e.g. "Bootleg cut".
+            color (str): Preferred colour, or None.
+            styles (tuple): Only products tagged with one of these styles,
+                or None for any style. Ignored if no product has those tags.
+            category (str): Only products in this category. Ignored if no
+                product is in it, as for categories like "necklines".
+            limit (int): Most products returned.
+
+        Returns:
+            list: Product dicts, best first.
+        """
+        # One consistent view of the index, however many updates land meanwhile
+        products, postings, ordered, style_filters = self._state
+        terms = [term for term in dict.fromkeys(tokenize(text)) if term in postings]
+        if not terms:
+            return []
+
+        filters = []
+        style_ids = self._style_filter(postings, style_filters, styles) if styles else None
+        if style_ids:
+            filters.append(style_ids)
+        if category:
+            category_ids = postings.get(_facet('category', stem(category.lower())))
+            if category_ids:
+                filters.append(category_ids)
+        color_ids = postings.get(_facet('color', color)) if color else None
+
+        # Most common word first, so the rarest are dropped first
+        terms.sort(key=lambda term: len(postings[term]), reverse=True)
+        found = []
+        seen = set()
+        while terms and len(found) < limit:
+            walk, *others = sorted(terms, key=lambda term: len(postings[term]))
+            required = [postings[term] for term in others] + filters
+            passes = (required + [color_ids], required) if color_ids else (required,)
+            for checks in passes:
+                for product_id in ordered[walk]:
+                    if product_id not in seen and all(product_id in ids for ids in checks):
+                        seen.add(product_id)
+                        found.append(product_id)
+                        if len(found) >= limit:
+                            break
+                if len(found) >= limit:
+                    break
+            terms.pop()
+        return [products[product_id] for product_id in found]
+
+    # --- Loading from the catalogue file ---
+
+    @classmethod
+    def from_file(cls, path):
+        index = cls(path)
+        index.apply_file_changes()
+        return index
+
+    def needs_rebuild(self, stat):
+        """True if the file was replaced or rewritten rather than appended to."""
+        if self._file_state is None:
+            return False
+        inode = self._file_state[0]
+        if stat.st_ino != inode or stat.st_size < self._offset:
+            return True
+        if not self._tail:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset - len(self._tail))
+            return f.read(len(self._tail)) != self._tail
+
+    def file_changed(self, stat):
+        return self._file_state != (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def apply_file_changes(self):
+        """
+        Apply the complete lines added to the catalogue file since the last
+        call. A line still being written is left for the next call.
+        """
+        try:
+            stat = os.stat(self.path)
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        upserts = {}
+        deletes = set()
+        for line_number, line in enumerate(data[:end].splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                product = json.loads(line)
+                product_id = product['id']
+            except (ValueError, KeyError, TypeError):
+                print(f"Error: skipping malformed line in {self.path} after byte {self._offset}")
+                continue
+            if product.get('deleted'):
+                upserts.pop(product_id, None)
+                deletes.add(product_id)
+            else:
+                deletes.discard(product_id)
+                upserts[product_id] = product
+        if upserts or deletes:
+            self.update(upserts.values(), deletes)
+        self._offset += end
+        if end:
+            self._tail = data[max(0, end - 64):end]
+        self._file_state = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+_catalog = None
+_catalog_checked_at = 0.0
+_catalog_lock = threading.Lock()
+
+
+def get_catalog(path):
+    """
+    Return the index of the catalogue at `path`, applying lines appended to
+    the file since it was last checked, or rebuilding it if the file was
+    replaced.
+    """
+    global _catalog, _catalog_checked_at
+    now = time.monotonic()
+    if _catalog is not None and _catalog.path == path and now - _catalog_checked_at < RELOAD_CHECK_INTERVAL:
+        return _catalog
+
+    with _catalog_lock:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if _catalog is None or _catalog.path != path or stat is None or _catalog.needs_rebuild(stat):
+            _catalog = CatalogIndex.from_file(path)
+        elif _catalog.file_changed(stat):
+            _catalog.apply_file_changes()
+        _catalog_checked_at = now
+        return _catalog
+
+
+def match_recommendations(recommendations, catalog, styles=None, limit=MATCHES_PER_ITEM):
+    """
+    Products for every `do` item of a generate_recommendations() result.
+
+    Returns:
+        dict: Maps each item's text to a list of product dicts.
+    """
+    matches = {}
+    for category, recs in recommendations.get('recommendations', {}).items():
+        for item in recs['do']:
+            text, color = split_recommendation_item(item)
+            matches[item] = catalog.match(text, color=color, styles=styles, category=category, limit=limit)
+    return matches
@@ -0,0 +1,197 @@
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from . import db
+from .models import UserImage
+
+analysis_cli = AppGroup('analysis', help='Maintain the analysis results of stored photos.')
+similarity_cli = AppGroup('similarity', help='Maintain the product similarity index.')
+
+CHECKPOINT_FILE = 'analysis_backfill.json'
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the database tables, indexes and folders the app needs.
+
+    Safe to run on every deploy: existing tables and indexes are left alone
+    and only missing ones are created.
+    """
+    from . import database
+
+    database.create_schema(current_app, db)
+    click.echo(f"Database ready: {current_app.config['SQLALCHEMY_DATABASE_URI']}")
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'last_id': 0, 'processed': 0}
+
+
+def _write_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _score_chunk(rows, results):
+    """
+    Turn a chunk of raw analysis results into UserImage updates.
+
+    Face shapes are re-derived from the detected rectangles and all skin tones
+    of the chunk are classified in one vectorized call, so the current
+    classification rules apply to every row.
+
+    Rows whose photo could not be read (missing or undecodable file) get no
+    update, so the results already stored for them are kept.
+    """
+    from .analysis import classify_face_shape_from_geometry, classify_skin_tones
+
+    sampled = [i for i, result in enumerate(results) if result['skin_rgb'] is not None]
+    tones = classify_skin_tones([results[i]['skin_rgb'] for i in sampled]) if sampled else []
+    tone_by_row = dict(zip(sampled, tones))
+
+    updates = []
+    for i, ((image_id, _), result) in enumerate(zip(rows, results)):
+        if 'detect' not in result['timings']:
+            continue
+        face = result['face']
+        update = {
+            'id': image_id,
+            'face_shape': classify_face_shape_from_geometry(face[2], face[3]) if face else "Unknown",
+            'skin_tone': str(tone_by_row[i]) if i in tone_by_row else "Unknown",
+            'analysis_complete': True,
+        }
+        if result.get('dominant_colors') is not None:
+            update['dominant_colors'] = json.dumps(result['dominant_colors'])
+        updates.append(update)
+    return updates
+
+
+@analysis_cli.command('backfill')
+@click.option('--chunk-size', default=200, show_default=True, help='Rows fetched, analyzed and written per batch.')
+@click.option('--workers', type=int, default=None, help='Worker processes [default: CPU count].')
+@click.option('--only-incomplete', is_flag=True, help='Only analyze rows whose analysis never finished.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first row.')
+@click.option('--limit', type=int, default=None, help='Stop after this many rows.')
+def backfill(chunk_size, workers, only_incomplete, restart, limit):
+    """Re-run analysis over stored photos in parallel.
+
+    Rows are processed in id order and a checkpoint is written to the
+    instance folder after every batch, so an interrupted run picks up where
+    it stopped.
+    """
+    from sqlalchemy import select, update
+
+    from .jobs import init_worker, run_analysis
+    from .pagecache import bump_content_versions
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    max_dim = current_app.config['DETECTION_MAX_DIM']
+    checkpoint_path = os.path.join(current_app.instance_path, CHECKPOINT_FILE)
+    checkpoint = {'last_id': 0, 'processed': 0} if restart else _read_checkpoint(checkpoint_path)
+    if checkpoint['last_id']:
+        click.echo(f"Resuming after image {checkpoint['last_id']} ({checkpoint['processed']} already processed)")
+
+    stage_seconds = defaultdict(float)
+    processed = 0
+    unreadable = []
+    exhausted = False
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        while limit is None or processed < limit:
+            batch = chunk_size if limit is None else min(chunk_size, limit - processed)
+            query = select(UserImage.id, UserImage.filename).where(UserImage.id > checkpoint['last_id'])
+            if only_incomplete:
+                query = query.where(UserImage.analysis_complete.isnot(True))
+            rows = db.session.execute(query.order_by(UserImage.id).limit(batch)).all()
+            if not rows:
+                exhausted = True
+                break
+
+            paths = [os.path.join(upload_folder, filename) for _, filename in rows]
+            stage_started = time.perf_counter()
+            results = list(executor.map(run_analysis, paths, repeat(max_dim), chunksize=max(1, len(rows) // 32)))
+            stage_seconds['analyze (wall)'] += time.perf_counter() - stage_started
+
+            for (image_id, _), result in zip(rows, results):
+                for stage, seconds in result['timings'].items():
+                    stage_seconds[stage] += seconds
+                if 'detect' not in result['timings']:
+                    unreadable.append(image_id)
+
+            stage_started = time.perf_counter()
+            updates = _score_chunk(rows, results)
+            stage_seconds['score'] += time.perf_counter() - stage_started
+
+            stage_started = time.perf_counter()
+            if updates:
+                db.session.execute(update(UserImage), updates)
+                bump_content_versions(db.session.scalars(
+                    select(UserImage.user_id).where(UserImage.id.in_([u['id'] for u in updates]))))
+                db.session.commit()
+            stage_seconds['write'] += time.perf_counter() - stage_started
+
+            # The checkpoint moves past unreadable rows too, so a resumed run
+            # does not retry them; use --restart once their files are back
+            processed += len(rows)
+            checkpoint = {'last_id': rows[-1][0], 'processed': checkpoint['processed'] + len(rows)}
+            _write_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - started
+            click.echo(f"{processed} images, {processed / elapsed:.1f} images/sec (last id {checkpoint['last_id']})")
+
+    elapsed = time.perf_counter() - started
+    if processed:
+        click.echo(f"Done: {processed} images in {elapsed:.1f}s, {processed / elapsed:.1f} images/sec, {len(unreadable)} unreadable")
+        for stage, seconds in stage_seconds.items():
+            click.echo(f"  {stage:<16} {seconds:8.2f}s total  {seconds / processed * 1000:8.2f}ms/image")
+        if unreadable:
+            shown = ', '.join(str(image_id) for image_id in unreadable[:20])
+            more = f" and {len(unreadable) - 20} more" if len(unreadable) > 20 else ""
+            click.echo(f"Left unchanged, photo missing or unreadable: images {shown}{more}")
+    else:
+        click.echo("Nothing to analyze.")
+    if exhausted and os.path.exists(checkpoint_path):
+        # A complete pass leaves no checkpoint behind for the next run
+        os.remove(checkpoint_path)
+
+
+@similarity_cli.command('build')
+@click.option('--clusters', type=int, default=None, help='k-means clusters [default: square root of the product count].')
+@click.option('--sample-size', type=int, default=None, help='Products k-means is trained on.')
+def build_similarity(clusters, sample_size):
+    """Encode the product catalogue and write the similarity index.
+
+    Running workers pick the new index up within a second; the old one is
+    replaced only once the new one is complete.
+    """
+    from .catalog import CatalogIndex
+    from .similarity import KMEANS_SAMPLE_SIZE, build_index
+
+    catalog_path = current_app.config['PRODUCT_CATALOG']
+    index_path = current_app.config['SIMILARITY_INDEX']
+    catalog = CatalogIndex.from_file(catalog_path)
+    if not len(catalog):
+        click.echo(f"No products in {catalog_path}.")
+        return
+
+    started = time.perf_counter()
+    stats = build_index(catalog.products(), index_path, n_clusters=clusters,
+                        sample_size=sample_size or KMEANS_SAMPLE_SIZE)
+    click.echo(f"Indexed {stats['products']} products in {stats['clusters']} clusters "
+               f"({stats['dim']} features) in {time.perf_counter() - started:.1f}s: {index_path}")
@@ -0,0 +1,96 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def is_sqlite_file(uri):
+    """True for a SQLite database stored in a file, as opposed to in memory."""
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure(app):
+    """
+    Fill in the engine options from the app config. Must run before
+    db.init_app(), which creates the engine.
+
+    Configuration:
+        DB_POOL_SIZE: Connections kept open per process. Size it to the number
+            of request threads plus the analysis result writer.
+        DB_MAX_OVERFLOW: Extra connections opened under bursts of load.
+        DB_POOL_TIMEOUT: Seconds to wait for a free connection before failing.
+        SQLITE_JOURNAL_MODE: WAL lets readers carry on while a write commits.
+        SQLITE_SYNCHRONOUS: NORMAL is safe with WAL and saves an fsync per commit.
+        SQLITE_BUSY_TIMEOUT: Milliseconds a writer waits for the lock before
+            raising "database is locked".
+    """
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT', 5000)
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if make_url(uri).get_backend_name() == 'sqlite' and not is_sqlite_file(uri):
+        # In-memory databases live in a single connection; leave their pool alone
+        return
+    options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+
+
+def install_sqlite_pragmas(engine, journal_mode='WAL', synchronous='NORMAL', busy_timeout=5000):
+    """Apply the given pragmas to every new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+            if journal_mode:
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            if synchronous:
+                cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        finally:
+            cursor.close()
+
+
+def ensure_indexes(db):
+    """
+    Create any index declared on the models that is missing from the database.
+
+    db.create_all() only creates indexes together with a new table, so indexes
+    added to an existing table are created here.
+    """
+    engine = db.engine
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def create_schema(app, db):
+    """
+    Create the instance and upload folders and any missing tables and
+    indexes. Run by `flask init-db` on deploy rather than on every boot.
+    """
+    os.makedirs(app.instance_path, exist_ok=True)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with app.app_context():
+        db.create_all()
+        ensure_indexes(db)
+
+
+def init_app(app, db):
+    """Set up the connection pragmas of an app's database."""
+    with app.app_context():
+        install_sqlite_pragmas(
+            db.engine,
+            journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+            synchronous=app.config['SQLITE_SYNCHRONOUS'],
+            busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+        )
@@ -0,0 +1,104 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+
+FRONTAL_FACE = 'haarcascade_frontalface_default.xml'
+
+
+class CascadePool:
+    """
+    Pool of CascadeClassifier instances built from a single cascade model.
+
+    The model XML is read from disk once per process. A classifier is not
+    safe to share between threads, so each caller checks out its own instance
+    for the duration of a detection and returns it afterwards; instances are
+    only parsed when every existing one is busy.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._xml = None
+        self._idle = []
+        self.instances = 0
+        self.hits = 0
+        self.load_seconds = 0.0
+
+    def _read_model(self):
+        if self._xml is None:
+            with open(cv2.data.haarcascades + self.model_name, 'r') as f:
+                self._xml = f.read()
+        return self._xml
+
+    def _build(self):
+        started = time.perf_counter()
+        with self._lock:
+            xml = self._read_model()
+        storage = cv2.FileStorage(xml, cv2.FILE_STORAGE_READ | cv2.FILE_STORAGE_MEMORY)
+        classifier = cv2.CascadeClassifier()
+        if not classifier.read(storage.getFirstTopLevelNode()):
+            raise RuntimeError(f"Could not load cascade model: {self.model_name}")
+        with self._lock:
+            self.instances += 1
+            self.load_seconds += time.perf_counter() - started
+        return classifier
+
+    @contextmanager
+    def acquire(self):
+        """Check out a classifier for the calling thread."""
+        with self._lock:
+            classifier = self._idle.pop() if self._idle else None
+            if classifier is not None:
+                self.hits += 1
+        if classifier is None:
+            classifier = self._build()
+        try:
+            yield classifier
+        finally:
+            with self._lock:
+                self._idle.append(classifier)
+
+    def warm_up(self, count=1):
+        """Make sure at least `count` idle classifiers are ready."""
+        with self._lock:
+            missing = count - len(self._idle)
+        built = [self._build() for _ in range(missing)]
+        with self._lock:
+            self._idle.extend(built)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'instances': self.instances,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'load_seconds': self.load_seconds,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(model_name=FRONTAL_FACE):
+    """Return the process-wide pool for a cascade model, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(model_name)
+        if pool is None:
+            pool = _pools[model_name] = CascadePool(model_name)
+        return pool
+
+
+def warm_up(model_names=(FRONTAL_FACE,), count=1):
+    """Parse the given cascade models ahead of the first request."""
+    for model_name in model_names:
+        get_pool(model_name).warm_up(count)
+
+
+def detector_stats():
+    """Load time and hit counts for every cascade pool in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.model_name: pool.stats() for pool in pools}
@@ -0,0 +1,94 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+
+from .models import UserImage
+
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
+# Columns needed to list an image; the palette JSON is only loaded by the
+# result page.
+HISTORY_COLUMNS = (
+    UserImage.id,
+    UserImage.filename,
+    UserImage.upload_date,
+    UserImage.face_shape,
+    UserImage.skin_tone,
+    UserImage.analysis_complete,
+)
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not produced by encode_cursor()."""
+
+
+def encode_cursor(image):
+    """An opaque cursor pointing just after `image` in the history order."""
+    raw = f'{image.upload_date.isoformat()}|{image.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: The (upload_date, id) the cursor points after.
+
+    Raises:
+        InvalidCursor: If the cursor cannot be decoded.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        upload_date, image_id = raw.split('|')
+        return datetime.fromisoformat(upload_date), int(image_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+def image_history(user, limit=HISTORY_PAGE_SIZE, cursor=None):
+    """
+    One page of a user's images, newest first.
+
+    Pages are found by keyset pagination on (upload_date, id): each page
+    starts right after the last row of the previous one, so a page costs the
+    same no matter how deep into the history it is, and uploads arriving in
+    between neither repeat nor skip rows.
+
+    Args:
+        user (User): Whose images to list.
+        limit (int): Page size, capped at MAX_HISTORY_PAGE_SIZE.
+        cursor (str): The `next_cursor` of the previous page, or None for the first.
+
+    Returns:
+        tuple: The list of images and the cursor of the next page, or None
+        on the last page.
+    """
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    query = user.images.options(load_only(*HISTORY_COLUMNS))
+    if cursor:
+        query = query.filter(tuple_(UserImage.upload_date, UserImage.id) < decode_cursor(cursor))
+    images = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(images[limit - 1]) if len(images) > limit else None
+    return images[:limit], next_cursor
+
+
+def latest_analysis(user):
+    """The user's most recent image with finished analysis, or None."""
+    return (user.images
+            .filter(UserImage.analysis_complete.is_(True))
+            .options(load_only(*HISTORY_COLUMNS))
+            .first())
+
+
+def image_summary(image):
+    """The JSON representation of a history entry."""
+    return {
+        'id': image.id,
+        'filename': image.filename,
+        'upload_date': image.upload_date.isoformat() if image.upload_date else None,
+        'analysis_complete': bool(image.analysis_complete),
+        'face_shape': image.face_shape,
+        'skin_tone': image.skin_tone,
+    }
@@ -0,0 +1,97 @@
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .cache import LRUCache
+from .models import User
+from .pagecache import remember_content_version
+
+# Columns kept for a logged-in user between requests. Deferred columns, such
+# as the style guide and the password hash, are left out and load from the
+# database the first time a request reads them.
+IDENTITY_COLUMNS = tuple(
+    prop.key for prop in User.__mapper__.column_attrs if not prop.deferred
+)
+
+USER_CACHE_SIZE = 4096
+# Bounds how long another worker process can serve a profile that was
+# changed elsewhere, on pages that are not cached (see refresh_user()).
+USER_CACHE_TTL = 30
+_user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def load_user(user_id):
+    """
+    Flask-Login user loader.
+
+    Flask-Login already calls this at most once per request. Across
+    requests, the user's light columns are cached for USER_CACHE_TTL seconds
+    and a cache hit rebuilds the User without a query: it is attached to the
+    session as if it had been loaded, so changes to it are saved as usual
+    and deferred columns still load on access.
+
+    A miss reads the row and the user's content version (see pagecache.py)
+    in one query, like the plain lookup it replaces. The version is cached
+    with the columns, and refresh_user() compares it with the current one.
+
+    Returns:
+        User: The user, or None if there is no such user.
+    """
+    from flask import g
+
+    user_id = int(user_id)
+    cached = _user_cache.get(user_id)
+    if cached is None:
+        return _load_user_row(user_id)
+
+    values, g.identity_version = cached
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _load_user_row(user_id):
+    """The user with their content version, read in one query, as on a cache miss."""
+    from flask import g
+    from sqlalchemy import select
+    from .models import ContentVersion
+
+    row = db.session.execute(
+        select(User, ContentVersion.version)
+        .outerjoin(ContentVersion, ContentVersion.user_id == User.id)
+        .where(User.id == user_id)
+        .execution_options(populate_existing=True)
+    ).first()
+    if row is None:
+        return None
+    user, version = row[0], row[1] or 0
+    remember_content_version(user_id, version)
+    _user_cache.set(user_id, ({key: getattr(user, key) for key in IDENTITY_COLUMNS}, version))
+    g.identity_version = version
+    return user
+
+
+def refresh_user(user_id, version):
+    """
+    Reload the current user from the database if their cached columns are
+    older than content version `version`.
+
+    Called by cached_page(), which reads the version anyway, so a profile
+    saved through another worker process never renders a page cached under
+    the new version from the old columns. Reloading refreshes the current
+    user in place.
+    """
+    from flask import g
+
+    if g.get('identity_version', version) < version:
+        _user_cache.invalidate(user_id)
+        _load_user_row(user_id)
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached columns after they have been changed or the user logged out."""
+    _user_cache.invalidate(user_id)
+
+
+def user_cache_stats():
+    """Hit, miss and eviction counts of the user cache."""
+    return _user_cache.stats()
@@ -0,0 +1,245 @@
+import atexit
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+# Bump whenever a change to the analysis pipeline can change its results, so
+# analyses cached under the previous version are not reused. Kept here rather
+# than in analysis.py so that cache lookups don't import OpenCV.
+ANALYZER_VERSION = '2'
+
+
+def init_worker():
+    """Load the face detector once in each worker process."""
+    from . import detectors
+    detectors.warm_up()
+
+
+def run_analysis(filepath, detection_max_dim):
+    """Analyze one image; runs inside a pool worker."""
+    from .analysis import analyze_image
+    return analyze_image(filepath, detection_max_dim)
+
+
+class AnalysisQueue:
+    """
+    Runs photo analysis off the request thread on a local process pool.
+
+    An upload is stored as a UserImage with analysis_complete=False and its id
+    handed to submit(). When the worker process is done, the results are
+    written back to that row and analysis_complete is set.
+
+    Results are also kept in AnalysisCache under the upload's content hash and
+    the current ANALYZER_VERSION, so submitting the same photo again fills
+    in the row straight away without running the analysis.
+
+    Results of the process pool are written by a single background thread,
+    which commits everything that finished within ANALYSIS_WRITE_DELAY in
+    one transaction. Under load that turns many short write transactions
+    competing for the SQLite lock into a few larger ones.
+
+    Configuration:
+        ANALYSIS_WORKERS: Size of the process pool. 0 analyzes inline in the
+            calling thread, which is handy for tests and debugging.
+        ANALYSIS_START_METHOD: multiprocessing start method for the pool,
+            None for the platform default.
+        ANALYSIS_WRITE_BATCH_SIZE: Most results committed in one transaction.
+            1 commits every result on its own as soon as it arrives.
+        ANALYSIS_WRITE_DELAY: Seconds the writer waits for more results
+            after the first one before committing.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_ready = threading.Condition()
+        self._writer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ANALYSIS_WORKERS', 2)
+        app.config.setdefault('ANALYSIS_START_METHOD', None)
+        app.config.setdefault('ANALYSIS_WRITE_BATCH_SIZE', 50)
+        app.config.setdefault('ANALYSIS_WRITE_DELAY', 0.05)
+        app.extensions['analysis_queue'] = self
+        self.app = app
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                config = self.app.config
+                self._executor = ProcessPoolExecutor(
+                    max_workers=config['ANALYSIS_WORKERS'],
+                    mp_context=multiprocessing.get_context(config['ANALYSIS_START_METHOD']),
+                    initializer=init_worker,
+                )
+            return self._executor
+
+    def submit(self, image_id, filepath, content_hash=None):
+        """
+        Queue analysis of the image stored at `filepath` for UserImage `image_id`.
+
+        Returns True if the results have already been stored, either from the
+        cache or because the analysis ran inline.
+        """
+        if content_hash is not None:
+            cached = self.cached_result(content_hash)
+            if cached is not None:
+                self._store(image_id, cached)
+                return True
+
+        max_dim = self.app.config['DETECTION_MAX_DIM']
+        if not self.app.config['ANALYSIS_WORKERS']:
+            try:
+                result = run_analysis(filepath, max_dim)
+            except Exception as e:
+                print(f"Error analyzing image {image_id}: {e}")
+                result = None
+            self._store(image_id, result, content_hash)
+            return True
+
+        try:
+            future = self._get_executor().submit(run_analysis, filepath, max_dim)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool and retry once
+            self.shutdown(wait=False)
+            future = self._get_executor().submit(run_analysis, filepath, max_dim)
+        future.add_done_callback(partial(self._on_done, image_id, content_hash))
+        return False
+
+    def cached_result(self, content_hash):
+        """Cached results for `content_hash` from the current analyzer, or None."""
+        from .models import AnalysisCache
+        from . import db
+
+        entry = db.session.get(AnalysisCache, (content_hash, ANALYZER_VERSION))
+        if entry is None:
+            return None
+        return {
+            'face_shape': entry.face_shape,
+            'skin_tone': entry.skin_tone,
+            'dominant_colors': json.loads(entry.dominant_colors) if entry.dominant_colors else None,
+        }
+
+    def _on_done(self, image_id, content_hash, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error analyzing image {image_id}: {e}")
+            result = None
+
+        if self.app.config['ANALYSIS_WRITE_BATCH_SIZE'] <= 1:
+            with self.app.app_context():
+                self._store(image_id, result, content_hash)
+            return
+
+        with self._pending_ready:
+            self._pending.append((image_id, result, content_hash))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_pending, name='analysis-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+            self._pending_ready.notify()
+
+    def _write_pending(self):
+        """Body of the writer thread: commit pending results in batches."""
+        batch_size = self.app.config['ANALYSIS_WRITE_BATCH_SIZE']
+        delay = self.app.config['ANALYSIS_WRITE_DELAY']
+        while True:
+            with self._pending_ready:
+                while not self._pending:
+                    self._pending_ready.wait()
+            # Give results finishing around the same time a chance to join
+            time.sleep(delay)
+            self.flush(batch_size)
+
+    def flush(self, batch_size=None):
+        """Commit all pending results, at most `batch_size` per transaction."""
+        while True:
+            with self._pending_ready:
+                if not self._pending:
+                    return
+                size = batch_size or len(self._pending)
+                batch, self._pending = self._pending[:size], self._pending[size:]
+            try:
+                with self.app.app_context():
+                    self._store_batch(batch)
+            except Exception as e:
+                print(f"Error storing analysis results for images {[entry[0] for entry in batch]}: {e}")
+
+    def _store(self, image_id, result, content_hash=None):
+        self._store_batch([(image_id, result, content_hash)])
+
+    def _store_batch(self, entries):
+        """
+        Write (image_id, result, content_hash) entries in one transaction.
+
+        A failed analysis (result None) still marks its image complete with
+        "Unknown" results, but is not cached so that the next upload tries again.
+        """
+        from sqlalchemy import select, update
+        from sqlalchemy.exc import IntegrityError
+        from .metrics import record_analysis_timings
+        from .models import AnalysisCache, UserImage
+        from .pagecache import bump_content_versions
+        from . import db
+
+        updates = []
+        cache_entries = {}
+        for image_id, result, content_hash in entries:
+            if result is not None and result.get('timings'):
+                record_analysis_timings(result['timings'])
+            values = result or {}
+            update_values = {
+                'id': image_id,
+                'face_shape': values.get('face_shape', "Unknown"),
+                'skin_tone': values.get('skin_tone', "Unknown"),
+                'analysis_complete': True,
+            }
+            if values.get('dominant_colors') is not None:
+                update_values['dominant_colors'] = json.dumps(values['dominant_colors'])
+            updates.append(update_values)
+            if content_hash is not None and result is not None:
+                cache_entries[content_hash] = AnalysisCache(
+                    content_hash=content_hash,
+                    analyzer_version=ANALYZER_VERSION,
+                    face_shape=result.get('face_shape'),
+                    skin_tone=result.get('skin_tone'),
+                    dominant_colors=update_values.get('dominant_colors'),
+                )
+
+        owners = dict(db.session.execute(
+            select(UserImage.id, UserImage.user_id).where(UserImage.id.in_([u['id'] for u in updates]))).all())
+        updates = [u for u in updates if u['id'] in owners]
+        if updates:
+            db.session.execute(update(UserImage), updates)
+            bump_content_versions(owners.values())
+        if cache_entries:
+            cached_hashes = set(db.session.scalars(select(AnalysisCache.content_hash).where(
+                AnalysisCache.content_hash.in_(list(cache_entries)),
+                AnalysisCache.analyzer_version == ANALYZER_VERSION)))
+            db.session.add_all(entry for content_hash, entry in cache_entries.items() if content_hash not in cached_hashes)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another process cached the same photo first; keep the image updates
+            db.session.rollback()
+            if updates:
+                db.session.execute(update(UserImage), updates)
+                bump_content_versions(owners.values())
+            db.session.commit()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+        if wait:
+            self.flush()
@@ -1,25 +1,34 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
-from flask_login import login_required, current_user
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file, abort
 from werkzeug.utils import secure_filename
+from flask_login import login_required, current_user
 import os
 import json
-from . import db
-from .models import User, UserImage
+from . import db, analysis_queue, product_search
+from .models import User, UserImage, WardrobeItem
 from .forms import UpdateProfileForm, StyleGuideForm, RegistrationForm, LoginForm
-from .analysis import detect_face_shape, analyze_skin_tone
-from .recommender import generate_recommendations
+from .recommender import generate_recommendations, invalidate_recommendations, allowed_styles_for_user
+from .catalog import get_catalog, match_recommendations
+from .identity import invalidate_user
+from .pagecache import cached_page, bump_content_versions
+from .uploads import save_upload, UploadRejected
+from .scraper import web_url
+from .thumbnails import get_thumbnail, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from .history import image_history, latest_analysis, image_summary, InvalidCursor, HISTORY_PAGE_SIZE
+from .metrics import RECOMMENDATION_SECONDS, UPLOAD_STAGE_SECONDS, PRODUCT_MATCH_SECONDS, ML_RECOMMENDATION_SECONDS
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
 @main.route('/index')
+@cached_page()
 def index():
     return render_template('index.html')
 
 @main.route('/dashboard')
 @login_required
+@cached_page()
 def dashboard():
-    return render_template('dashboard.html', user=current_user)
+    return render_template('dashboard.html', user=current_user, latest=latest_analysis(current_user))
 
 @main.route('/profile', methods=['GET', 'POST'])
 @login_required
@@ -35,7 +44,10 @@ def profile():
         current_user.body_shape = form.body_shape.data
         current_user.location_climate = form.location_climate.data
         current_user.fashion_style = form.fashion_style.data
+        bump_content_versions([current_user.id])
         db.session.commit()
+        invalidate_recommendations(current_user.id)
+        invalidate_user(current_user.id)
         flash('Your profile has been updated!', 'success')
         return redirect(url_for('main.profile'))
     elif request.method == 'GET':
@@ -68,7 +80,10 @@ def style_guide():
             'preferred_stores': form.preferred_stores.data,
         }
         current_user.style_guide_data = json.dumps(guide_data)
+        bump_content_versions([current_user.id])
         db.session.commit()
+        invalidate_recommendations(current_user.id)
+        invalidate_user(current_user.id)
         flash('Your Style Guide has been saved!', 'success')
         return redirect(url_for('main.style_guide'))
     elif request.method == 'GET' and current_user.style_guide_data:
@@ -102,39 +117,199 @@ def analysis():
             flash('No selected file', 'danger')
             return redirect(request.url)
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
             from flask import current_app
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            face_shape = detect_face_shape(filepath)
-            skin_tone = analyze_skin_tone(filepath)
+            upload_folder = current_app.config['UPLOAD_FOLDER']
+            try:
+                with UPLOAD_STAGE_SECONDS.time('save'):
+                    filename, content_hash = save_upload(
+                        file, upload_folder,
+                        max_bytes=current_app.config['MAX_CONTENT_LENGTH'],
+                        max_pixels=current_app.config['MAX_IMAGE_PIXELS'],
+                    )
+            except UploadRejected as e:
+                flash(str(e), 'danger')
+                return redirect(request.url)
 
             image_record = UserImage(
                 user_id=current_user.id,
                 filename=filename,
-                face_shape=face_shape,
-                skin_tone=skin_tone,
-                analysis_complete=True
+                analysis_complete=False
             )
-            db.session.add(image_record)
-            db.session.commit()
+            with UPLOAD_STAGE_SECONDS.time('db_commit'):
+                db.session.add(image_record)
+                bump_content_versions([current_user.id])
+                db.session.commit()
 
-            flash('Image analyzed successfully!', 'success')
-            return render_template('analysis_result.html', image=image_record)
+            with UPLOAD_STAGE_SECONDS.time('submit'):
+                analyzed = analysis_queue.submit(image_record.id, os.path.join(upload_folder, filename), content_hash)
+            if analyzed:
+                flash('Image analyzed successfully!', 'success')
+            else:
+                flash('Image uploaded! Your results will appear here shortly.', 'success')
+            return redirect(url_for('main.analysis_result', image_id=image_record.id))
 
     return render_template('analysis.html', title='Analyze Photo')
 
+@main.app_errorhandler(413)
+def upload_too_large(error):
+    from flask import current_app
+    limit = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'That image is too large; the limit is {limit} MB.', 'danger')
+    return redirect(url_for('main.analysis'))
+
+@main.route('/analysis/<int:image_id>')
+@login_required
+def analysis_result(image_id):
+    image = UserImage.query.filter_by(id=image_id, user_id=current_user.id).first_or_404()
+    return render_template('analysis_result.html', title='Analysis Results', image=image)
+
+@main.route('/analysis/<int:image_id>/status')
+@login_required
+def analysis_status(image_id):
+    image = UserImage.query.filter_by(id=image_id, user_id=current_user.id).first_or_404()
+    return jsonify(
+        id=image.id,
+        analysis_complete=bool(image.analysis_complete),
+        face_shape=image.face_shape,
+        skin_tone=image.skin_tone,
+        dominant_colors=image.palette,
+    )
+
+@main.route('/thumbnails/<size>/<fmt>/<filename>')
+@login_required
+def thumbnail(size, fmt, filename):
+    from flask import current_app
+    # Stored names are content hashes, so a thumbnail URL never changes what
+    # it points to and browsers may keep it for as long as they like
+    if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS or secure_filename(filename) != filename:
+        abort(404)
+    path = get_thumbnail(current_app.config['UPLOAD_FOLDER'], filename, size, fmt)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=THUMBNAIL_FORMATS[fmt][1], conditional=True, etag=True,
+                         max_age=current_app.config['THUMBNAIL_MAX_AGE'])
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@main.route('/history')
+@login_required
+def history():
+    try:
+        images, next_cursor = image_history(current_user, cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        return redirect(url_for('main.history'))
+    return render_template('history.html', title='Your Photos', images=images, next_cursor=next_cursor)
+
+@main.route('/api/history')
+@login_required
+def history_api():
+    try:
+        images, next_cursor = image_history(
+            current_user,
+            limit=request.args.get('limit', HISTORY_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor'),
+        )
+    except InvalidCursor:
+        return jsonify(error='Invalid cursor'), 400
+    return jsonify(images=[image_summary(image) for image in images], next_cursor=next_cursor)
+
+@main.route('/search')
+@login_required
+def search():
+    query = request.args.get('query', '').strip()
+    if not query:
+        flash('Please enter something to search for.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    store = request.args.get('store')
+    stores = [store] if store in product_search.stores else None
+    results = product_search.search(query, stores)
+    return render_template('search_results.html', title=f'Search: {query}', query=query, results=results)
+
+@main.route('/wardrobe')
+@login_required
+def wardrobe():
+    items = WardrobeItem.query.filter_by(user_id=current_user.id).order_by(WardrobeItem.added_date.desc()).all()
+    return render_template('wardrobe.html', title='My Wardrobe', items=items)
+
+@main.route('/wardrobe/save', methods=['POST'])
+@login_required
+def save_item():
+    product_name = request.form.get('product_name', '').strip()
+    if not product_name:
+        flash('That item could not be saved.', 'danger')
+        return redirect(url_for('main.wardrobe'))
+    item = WardrobeItem(
+        user_id=current_user.id,
+        product_name=product_name[:200],
+        brand=request.form.get('brand', '').strip()[:100],
+        price=request.form.get('price', '').strip()[:50],
+        # Anything but an http(s) URL is dropped, see web_url()
+        image_url=web_url(request.form.get('image_url'))[:500],
+        product_link=web_url(request.form.get('product_link'))[:500],
+    )
+    db.session.add(item)
+    db.session.commit()
+    flash(f'Saved {item.product_name} to your wardrobe!', 'success')
+    return redirect(url_for('main.wardrobe'))
+
+@main.route('/wardrobe/<int:item_id>/notes', methods=['POST'])
+@login_required
+def edit_notes(item_id):
+    item = WardrobeItem.query.filter_by(id=item_id, user_id=current_user.id).first_or_404()
+    item.notes = request.form.get('notes', '').strip()
+    db.session.commit()
+    flash('Your note has been saved.', 'success')
+    return redirect(url_for('main.wardrobe'))
+
+@main.route('/wardrobe/<int:item_id>/delete', methods=['POST'])
+@login_required
+def delete_item(item_id):
+    item = WardrobeItem.query.filter_by(id=item_id, user_id=current_user.id).first_or_404()
+    db.session.delete(item)
+    db.session.commit()
+    flash('The item has been removed from your wardrobe.', 'success')
+    return redirect(url_for('main.wardrobe'))
+
+def recommendations_stamp():
+    """Versions of the inputs every user's recommendations page shares."""
+    from flask import current_app
+    from .recommender import get_recommendation_index
+    from .similarity import get_similarity_index
+    similarity_index = get_similarity_index(current_app.config['SIMILARITY_INDEX'])
+    return (
+        get_recommendation_index().version,
+        get_catalog(current_app.config['PRODUCT_CATALOG']).version,
+        similarity_index.version if similarity_index is not None else None,
+    )
+
 @main.route('/recommendations')
 @login_required
+@cached_page(recommendations_stamp)
 def recommendations():
-    rule_based_recs = generate_recommendations(current_user)
-    # This is a placeholder for the ML-based recommendations
+    from flask import current_app
+    with RECOMMENDATION_SECONDS.time():
+        rule_based_recs = generate_recommendations(current_user)
+    # Catalogue products for each recommended item
+    product_matches = {}
+    catalog = get_catalog(current_app.config['PRODUCT_CATALOG'])
+    if len(catalog) and not rule_based_recs.get('error'):
+        with PRODUCT_MATCH_SECONDS.time():
+            product_matches = match_recommendations(rule_based_recs, catalog, styles=allowed_styles_for_user(current_user))
+    # Products closest to the user's profile, other than those matched above
+    from .similarity import get_similarity_index, ml_recommendations
     ml_recs = []
+    similarity_index = get_similarity_index(current_app.config['SIMILARITY_INDEX'])
+    if similarity_index is not None and len(catalog) and not rule_based_recs.get('error'):
+        shown = {str(product['id']) for products in product_matches.values() for product in products}
+        with ML_RECOMMENDATION_SECONDS.time():
+            ml_recs = ml_recommendations(current_user, similarity_index, catalog, exclude=shown)
 
     return render_template(
         'recommendations.html',
         title='Your Recommendations',
         recommendations=rule_based_recs,
+        product_matches=product_matches,
         ml_recommendations=ml_recs
     )
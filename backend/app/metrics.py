@@ -0,0 +1,310 @@
+import cProfile
+import math
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets, in seconds.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram with a fixed set of label names.
+
+    Metrics live in the memory of the process that records them; with several
+    worker processes, each one exposes its own numbers.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe how long the body of the `with` block takes."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            label_pairs = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                yield f'{self.name}_bucket', label_pairs + [('le', le)], cumulative
+            yield f'{self.name}_sum', label_pairs, total
+            yield f'{self.name}_count', label_pairs, count
+
+
+class Counter:
+    """A Prometheus-style counter with a fixed set of label names."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, labels)), value
+
+
+class Registry:
+    """Holds metrics and stats collectors and renders them as Prometheus text."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def add_collector(self, collector):
+        """
+        Register a callable run at scrape time. It returns a list of
+        (name, type, help, [(labels_dict, value), ...]) tuples, which is how
+        stats kept elsewhere, such as cache counters, are exported.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for collector in collectors:
+            for name, metric_type, help, samples in collector():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.items())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    labels = list(labels)
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'lookcircuit_request_duration_seconds', 'Time spent handling HTTP requests.',
+    ('endpoint', 'method', 'status'))
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'lookcircuit_db_query_duration_seconds', 'Time spent executing SQL statements.', ('statement',))
+TEMPLATE_SECONDS = REGISTRY.histogram(
+    'lookcircuit_template_render_seconds', 'Time spent rendering templates.', ('template',))
+ANALYSIS_STAGE_SECONDS = REGISTRY.histogram(
+    'lookcircuit_analysis_stage_seconds', 'Time spent in each stage of photo analysis.', ('stage',))
+UPLOAD_STAGE_SECONDS = REGISTRY.histogram(
+    'lookcircuit_upload_stage_seconds', 'Time spent in each step of handling a photo upload.', ('stage',))
+RECOMMENDATION_SECONDS = REGISTRY.histogram(
+    'lookcircuit_recommendation_seconds', 'Time spent generating rule-based recommendations.')
+PRODUCT_MATCH_SECONDS = REGISTRY.histogram(
+    'lookcircuit_product_match_seconds', 'Time spent matching recommendations to catalogue products.')
+ML_RECOMMENDATION_SECONDS = REGISTRY.histogram(
+    'lookcircuit_ml_recommendation_seconds', 'Time spent finding the products closest to a user profile.')
+PROFILED_REQUESTS = REGISTRY.counter(
+    'lookcircuit_profiled_requests_total', 'Requests recorded with cProfile.', ('endpoint',))
+
+# Held by the request being profiled. Only one profiler can be active in a
+# process at a time; Python 3.12+ raises ValueError for a second one.
+_profile_lock = threading.Lock()
+
+
+def record_analysis_timings(timings):
+    """Record the per-stage timings returned by analysis.analyze_image."""
+    for stage, seconds in timings.items():
+        ANALYSIS_STAGE_SECONDS.observe(seconds, stage)
+
+
+def _cache_stats_collector():
+    from . import product_search
+    from .identity import user_cache_stats
+    from .pagecache import page_cache_stats
+    from .recommender import recommendation_cache_stats
+
+    caches = {
+        'recommendations': recommendation_cache_stats(),
+        'users': user_cache_stats(),
+        'product_search': product_search.cache_stats(),
+        'pages': page_cache_stats(),
+    }
+    # Only report detectors already loaded here, rather than importing OpenCV
+    # just to say there are none
+    detectors_module = sys.modules.get(__package__ + '.detectors')
+    detectors = detectors_module.detector_stats() if detectors_module else {}
+    return [
+        ('lookcircuit_cache_hits_total', 'counter', 'Cache hits.',
+         [({'cache': name}, stats['hits']) for name, stats in caches.items()]),
+        ('lookcircuit_cache_misses_total', 'counter', 'Cache misses.',
+         [({'cache': name}, stats['misses']) for name, stats in caches.items()]),
+        ('lookcircuit_cache_evictions_total', 'counter', 'Cache entries evicted for space.',
+         [({'cache': name}, stats['evictions']) for name, stats in caches.items()]),
+        ('lookcircuit_cache_entries', 'gauge', 'Entries currently cached.',
+         [({'cache': name}, stats['size']) for name, stats in caches.items()]),
+        ('lookcircuit_detector_instances', 'gauge', 'Face detector instances loaded in this process.',
+         [({'model': name}, stats['instances']) for name, stats in detectors.items()]),
+        ('lookcircuit_detector_hits_total', 'counter', 'Face detector checkouts served by a loaded instance.',
+         [({'model': name}, stats['hits']) for name, stats in detectors.items()]),
+        ('lookcircuit_detector_load_seconds_total', 'counter', 'Time spent parsing face detector models.',
+         [({'model': name}, stats['load_seconds']) for name, stats in detectors.items()]),
+    ]
+
+
+REGISTRY.add_collector(_cache_stats_collector)
+
+
+def init_app(app, db):
+    """
+    Instrument an app: request, SQL and template timings, the /metrics
+    endpoint and optional cProfile sampling.
+
+    Configuration:
+        METRICS_ENABLED: Serve /metrics in Prometheus text format.
+        PROFILE_SAMPLE_RATE: Fraction of requests to run under cProfile, one
+            at a time per process.
+        PROFILE_DIR: Where the .prof files of sampled requests are written.
+    """
+    from flask import Response, before_render_template, g, request, template_rendered
+    from sqlalchemy import event
+
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    @app.before_request
+    def start_request_timer():
+        g._metrics_started = time.perf_counter()
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        # Requests sampled while another one is profiled are not profiled
+        if rate and random.random() < rate and _profile_lock.acquire(blocking=False):
+            g._profile_lock_held = True
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler, such as a debugger's, is active
+                return
+            g._profiler = profiler
+
+    @app.after_request
+    def record_request(response):
+        profiler = g.pop('_profiler', None)
+        endpoint = request.endpoint or 'unmatched'
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{os.getpid()}-{threading.get_ident()}.prof'
+            profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], filename))
+            PROFILED_REQUESTS.inc(endpoint)
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def release_profiler(exc):
+        # after_request has already stopped the profiler unless it was skipped
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        if g.pop('_profile_lock_held', False):
+            _profile_lock.release()
+
+    def start_template_timer(sender, template, context, **extra):
+        g.setdefault('_template_timers', []).append(time.perf_counter())
+
+    def record_template(sender, template, context, **extra):
+        timers = g.get('_template_timers')
+        if timers:
+            TEMPLATE_SECONDS.observe(time.perf_counter() - timers.pop(), template.name or 'unknown')
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(record_template, app, weak=False)
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_timers', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        timers = conn.info.get('_query_timers')
+        if timers:
+            kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+            DB_QUERY_SECONDS.observe(time.perf_counter() - timers.pop(), kind)
+
+    @app.route('/metrics')
+    def metrics():
+        if not app.config['METRICS_ENABLED']:
+            return Response(status=404)
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
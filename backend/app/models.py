@@ -2,12 +2,14 @@ from . import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy.orm import deferred
+import json
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=False)
+    password_hash = deferred(db.Column(db.String(256), nullable=False)) # Only needed to log in
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # --- Profile Information ---
@@ -20,10 +22,12 @@ class User(UserMixin, db.Model):
     fashion_style = db.Column(db.String(100)) # e.g., Gen-Z, Millennial
 
     # --- Style Guide & Analysis Data ---
-    style_guide_data = db.Column(db.Text) # To store JSON data from the questionnaire
+    style_guide_data = deferred(db.Column(db.Text)) # To store JSON data from the questionnaire; loaded on first access
 
-    # Relationship to images
-    images = db.relationship('UserImage', backref='user', lazy=True)
+    # Relationship to images, newest first. Dynamic, so that it is a query to
+    # narrow down (see history.py) rather than a list loaded in full.
+    images = db.relationship('UserImage', backref='user', lazy='dynamic',
+                             order_by=lambda: (UserImage.upload_date.desc(), UserImage.id.desc()))
     # Removing wardrobe relationship
     # interactions = db.relationship('UserInteraction', backref='user', lazy=True)
 
@@ -37,10 +41,15 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 class UserImage(db.Model):
+    __table_args__ = (
+        # Serves both "this user's images" and "newest first" per user
+        db.Index('ix_user_image_user_id_upload_date', 'user_id', 'upload_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
-    upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # --- Analysis Results ---
     face_shape = db.Column(db.String(50))
@@ -48,5 +57,45 @@ class UserImage(db.Model):
     dominant_colors = db.Column(db.Text) # Storing as JSON string
     analysis_complete = db.Column(db.Boolean, default=False)
 
+    @property
+    def palette(self):
+        """The dominant colours as a list of {'hex', 'ratio'} dicts."""
+        return json.loads(self.dominant_colors) if self.dominant_colors else []
+
     def __repr__(self):
         return f'<UserImage {self.filename}>'
+
+class WardrobeItem(db.Model):
+    """A product a user saved from search results."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_name = db.Column(db.String(200), nullable=False)
+    brand = db.Column(db.String(100), nullable=False)
+    price = db.Column(db.String(50))
+    image_url = db.Column(db.String(500))
+    product_link = db.Column(db.String(500))
+    notes = db.Column(db.Text)
+    added_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WardrobeItem {self.product_name}>'
+
+class ContentVersion(db.Model):
+    """Bumped whenever a user's pages may render differently, see pagecache.py."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ContentVersion user {self.user_id} v{self.version}>'
+
+class AnalysisCache(db.Model):
+    """Analysis results for an upload's content hash, per analyzer version."""
+    content_hash = db.Column(db.String(64), primary_key=True)
+    analyzer_version = db.Column(db.String(20), primary_key=True)
+    face_shape = db.Column(db.String(50))
+    skin_tone = db.Column(db.String(50))
+    dominant_colors = db.Column(db.Text) # Storing as JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AnalysisCache {self.content_hash[:12]} v{self.analyzer_version}>'
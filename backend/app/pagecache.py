@@ -0,0 +1,136 @@
+import hashlib
+from functools import wraps
+
+from .cache import LRUCache
+
+# Rendered pages kept per worker, see cached_page().
+PAGE_CACHE_SIZE = 1024
+PAGE_CACHE_TTL = 600
+_page_cache = LRUCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+
+
+def content_version(user_id):
+    """
+    The user's current ContentVersion, 0 if it was never bumped.
+
+    Read at most once per request: the user loader and cached_page() share
+    the result.
+    """
+    from flask import g, has_request_context
+    from sqlalchemy import select
+    from . import db
+    from .models import ContentVersion
+
+    versions = g.setdefault('content_versions', {}) if has_request_context() else {}
+    if user_id not in versions:
+        versions[user_id] = db.session.execute(
+            select(ContentVersion.version).where(ContentVersion.user_id == user_id)).scalar() or 0
+    return versions[user_id]
+
+
+def remember_content_version(user_id, version):
+    """Record a version read together with other rows, so content_version() does not query it again."""
+    from flask import g, has_request_context
+
+    if has_request_context():
+        g.setdefault('content_versions', {})[user_id] = version
+
+
+def bump_content_versions(user_ids):
+    """
+    Mark the pages of these users as changed.
+
+    Runs in the caller's transaction, so the new version becomes visible to
+    other workers together with the change it stands for. Call it before
+    the commit that stores the change.
+    """
+    from flask import g, has_request_context
+    from sqlalchemy import select, update
+    from . import db
+    from .models import ContentVersion
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    if has_request_context():
+        for user_id in user_ids:
+            g.get('content_versions', {}).pop(user_id, None)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(ContentVersion).values([{'user_id': user_id, 'version': 1} for user_id in user_ids])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[ContentVersion.user_id], set_={'version': ContentVersion.version + 1}))
+        return
+    db.session.execute(update(ContentVersion).where(ContentVersion.user_id.in_(user_ids))
+                       .values(version=ContentVersion.version + 1))
+    existing = set(db.session.scalars(select(ContentVersion.user_id).where(ContentVersion.user_id.in_(user_ids))))
+    db.session.add_all(ContentVersion(user_id=user_id, version=1) for user_id in user_ids - existing)
+
+
+def cached_page(stamp=None):
+    """
+    Serve a GET view from memory while its inputs are unchanged.
+
+    A rendered page is cached per endpoint, URL and user, under the user's
+    content version plus whatever `stamp()` returns for inputs shared by
+    all users, such as the recommendation data. Responses carry a strong
+    ETag over the body and `Cache-Control: private, no-cache`, so browsers
+    revalidate every time and get a 304 while the page is unchanged.
+
+    The current user is reloaded first if their columns were cached under
+    an older content version, see identity.refresh_user().
+
+    Requests with flashed messages waiting are rendered as usual and not
+    cached, since the messages are shown only once.
+
+    Args:
+        stamp (callable): Returns a hashable version of the shared inputs.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import current_app, make_response, request, session
+            from flask_login import current_user
+            from .identity import refresh_user
+
+            if not current_app.config['PAGE_CACHE_ENABLED'] or request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            user_id = current_user.get_id()
+            key = (request.endpoint, request.full_path, user_id)
+            # Read the versions before rendering, so a change committed
+            # meanwhile can only make the cached page newer than its version
+            version = (content_version(int(user_id)) if user_id else 0, stamp() if stamp else None)
+            if user_id:
+                refresh_user(int(user_id), version[0])
+            entry = _page_cache.get(key, version=version)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.blake2b(body, digest_size=16).hexdigest())
+                _page_cache.set(key, entry, version=version)
+
+            body, mimetype, etag = entry
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def clear_page_cache():
+    _page_cache.clear()
+
+
+def page_cache_stats():
+    """Hit, miss and eviction counts of the rendered page cache."""
+    return _page_cache.stats()
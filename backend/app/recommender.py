@@ -1,11 +1,35 @@
 import json
 import os
+import threading
+import time
+from types import MappingProxyType
+
+from .cache import LRUCache
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), 'recommendation_data.json')
+
+# How often, in seconds, the data file's mtime is checked for changes.
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Styles a user sees for each fashion risk tolerance. Anything else only gets
+# classic items.
+STYLES_BY_RISK_TOLERANCE = {
+    'moderate': ('classic', 'trendy'),
+    'adventurous': ('classic', 'trendy', 'adventurous'),
+}
+DEFAULT_STYLES = ('classic',)
+STYLE_LEVELS = (DEFAULT_STYLES,) + tuple(STYLES_BY_RISK_TOLERANCE.values())
+
+# Per-user results of generate_recommendations, see recommendation_cache_stats().
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_TTL = 600
+_result_cache = LRUCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
 
 def load_recommendation_data():
     """Loads the recommendation data from the JSON file."""
     # Correct path assuming the script is run from the root of the `backend` directory
     # or the app context is configured correctly.
-    filepath = os.path.join(os.path.dirname(__file__), 'recommendation_data.json')
+    filepath = DATA_FILE
     try:
         with open(filepath, 'r') as f:
             return json.load(f)
@@ -16,60 +40,145 @@ def load_recommendation_data():
         print(f"Error: Could not decode JSON from recommendation_data.json")
         return {}
 
+class RecommendationIndex:
+    """
+    Recommendation data compiled for lookups by (body_shape, allowed styles).
+
+    Every body shape is compiled once per style level: the `do` lists are
+    filtered by style tag up front and stored, with the `dont` lists, as
+    tuples. Requests only pick an entry and assemble a response around it.
+    """
+
+    def __init__(self, data, version):
+        self.version = version
+        self.valid = bool(data) and 'body_shapes' in data
+        shapes = {}
+        for body_shape, base in (data.get('body_shapes', {}) if self.valid else {}).items():
+            fields = MappingProxyType({k: v for k, v in base.items() if k != 'recommendations'})
+            for styles in STYLE_LEVELS:
+                categories = tuple(
+                    (category, self._filter_dos(recs.get('do', []), styles), tuple(recs.get('dont', [])))
+                    for category, recs in base.get('recommendations', {}).items()
+                )
+                shapes[body_shape, styles] = (fields, categories)
+        self._shapes = MappingProxyType(shapes)
+        self.body_shapes = frozenset(body_shape for body_shape, _ in shapes)
+
+    @staticmethod
+    def _filter_dos(items, allowed_styles):
+        filtered_dos = []
+        for item_data in items:
+            # Check if the item is a dict with style_tags
+            if isinstance(item_data, dict):
+                # If any of the item's tags are in the allowed styles, keep it
+                if any(tag in allowed_styles for tag in item_data.get('style_tags', [])):
+                    filtered_dos.append(item_data['item'])
+            else: # It's an old-style string item, keep it by default
+                filtered_dos.append(item_data)
+        return tuple(filtered_dos)
+
+    def lookup(self, body_shape, allowed_styles):
+        """The compiled (fields, categories) entry, or None for an unknown body shape."""
+        return self._shapes.get((body_shape, allowed_styles))
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+def get_recommendation_index():
+    """
+    Return the compiled recommendation index, rebuilding it when the data
+    file's mtime has changed since it was last compiled.
+    """
+    global _index, _index_checked_at
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < RELOAD_CHECK_INTERVAL:
+        return _index
+
+    with _index_lock:
+        try:
+            mtime = os.stat(DATA_FILE).st_mtime_ns
+        except OSError:
+            mtime = None
+        if _index is None or _index.version != mtime:
+            _index = RecommendationIndex(load_recommendation_data(), mtime)
+        _index_checked_at = now
+        return _index
+
+def allowed_styles_for(risk_tolerance):
+    return STYLES_BY_RISK_TOLERANCE.get(risk_tolerance, DEFAULT_STYLES)
+
+def allowed_styles_for_user(user):
+    """The styles a user's recommendations are filtered to, from their style guide."""
+    style_guide = json.loads(user.style_guide_data) if user.style_guide_data else {}
+    return allowed_styles_for(style_guide.get('fashion_risk_tolerance', 'moderate'))
+
 def generate_recommendations(user):
     """
     Generates fashion recommendations based on a user's full profile.
 
+    Results are cached per user. The cached entry is only used while the
+    user's body shape and style guide and the recommendation data are the
+    same as when it was computed, and invalidate_recommendations() drops it
+    as soon as the profile or style guide is saved.
+
     Args:
         user (User): The user object containing all profile and style guide data.
 
     Returns:
-        dict: A dictionary containing recommendations for the user.
+        dict: A dictionary containing recommendations for the user. The
+        result is shared between requests and must not be modified.
+    """
+    index = get_recommendation_index()
+    fingerprint = (user.body_shape, user.style_guide_data, index.version)
+    recommendations = _result_cache.get(user.id, version=fingerprint)
+    if recommendations is None:
+        recommendations = build_recommendations(user, index)
+        _result_cache.set(user.id, recommendations, version=fingerprint)
+    return recommendations
+
+def invalidate_recommendations(user_id):
+    """Forget the cached recommendations of a user whose inputs changed."""
+    _result_cache.invalidate(user_id)
+
+def recommendation_cache_stats():
+    """Hit, miss and eviction counts of the per-user result cache."""
+    return _result_cache.stats()
+
+def build_recommendations(user, index=None):
+    """
+    Builds the recommendations for a user without consulting the cache.
+
+    Returns:
+        dict: A dictionary containing recommendations for the user. The `do`
+        and `dont` lists are tuples shared with the index and must not be
+        modified.
     """
-    data = load_recommendation_data()
+    index = index or get_recommendation_index()
     body_shape = user.body_shape
 
-    if not data or 'body_shapes' not in data:
+    if not index.valid:
         return {"error": "Recommendation data is missing or corrupt."}
 
-    if not body_shape or body_shape not in data['body_shapes']:
+    if not body_shape or body_shape not in index.body_shapes:
         return {"error": f"No recommendations available for body shape: '{body_shape}'. Please complete your profile."}
 
-    base_recommendations = data['body_shapes'][body_shape]
     style_guide = json.loads(user.style_guide_data) if user.style_guide_data else {}
 
-    # Create a deep copy to modify
-    import copy
-    final_recommendations = copy.deepcopy(base_recommendations)
-
     # --- Filter by Style & Risk Tolerance ---
     risk_tolerance = style_guide.get('fashion_risk_tolerance', 'moderate')
-
-    allowed_styles = ['classic']
-    if risk_tolerance == 'moderate':
-        allowed_styles.append('trendy')
-    elif risk_tolerance == 'adventurous':
-        allowed_styles.extend(['trendy', 'adventurous'])
-
-    for category, recs in final_recommendations.get('recommendations', {}).items():
-        filtered_dos = []
-        for item_data in recs.get('do', []):
-            # Check if the item is a dict with style_tags
-            if isinstance(item_data, dict):
-                # If any of the item's tags are in the allowed styles, keep it
-                if any(tag in allowed_styles for tag in item_data.get('style_tags', [])):
-                    filtered_dos.append(item_data['item'])
-            else: # It's an old-style string item, keep it by default
-                filtered_dos.append(item_data)
-        recs['do'] = filtered_dos
+    fields, categories = index.lookup(body_shape, allowed_styles_for(risk_tolerance))
 
     # --- Enhance with Color Preferences ---
-    preferred_colors = style_guide.get('preferred_colors', '').split(',')
+    preferred_colors = (style_guide.get('preferred_colors') or '').split(',')
     preferred_color = preferred_colors[0].strip() if preferred_colors else ""
 
-    if preferred_color:
-        for category, recs in final_recommendations.get('recommendations', {}).items():
-            for i, item_text in enumerate(recs.get('do', [])):
-                recs['do'][i] = f"{item_text} (consider in {preferred_color})"
+    recommendations = {}
+    for category, dos, donts in categories:
+        if preferred_color:
+            dos = tuple(f"{item_text} (consider in {preferred_color})" for item_text in dos)
+        recommendations[category] = {'do': dos, 'dont': donts}
 
+    final_recommendations = dict(fields)
+    final_recommendations['recommendations'] = recommendations
     return final_recommendations
@@ -0,0 +1,343 @@
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote, quote_plus, urljoin, urlsplit
+
+from .cache import LRUCache
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/99.0.4844.84 Safari/537.36')
+
+# Selectors shared by stores running on Shopify themes.
+SHOPIFY_SELECTORS = {
+    'item': '.product-card, .card-wrapper, .grid-product, .product-item',
+    'title': '.card__heading, .product-card__title, .grid-product__title, .product-item__title',
+    'price': '.price-item--sale, .price-item, .product-card__price, .grid-product__price, .price',
+    'image': 'img',
+    'link': 'a[href]',
+}
+
+# Stores searched by default. `name` is shown to users and `url` is formatted
+# with the URL-quoted query as {query} and a dash-separated version as {slug}.
+# `item` selects the product cards on the results page, and title, brand,
+# price, image and link select each field within a card. Sites change their
+# markup, so these live in config (PRODUCT_STORES) and can be replaced
+# without a code change.
+DEFAULT_STORES = {
+    'myntra': {
+        'name': 'Myntra',
+        'url': 'https://www.myntra.com/{slug}',
+        'item': 'li.product-base',
+        'title': 'h4.product-product',
+        'brand': 'h3.product-brand',
+        'price': '.product-discountedPrice, .product-price span',
+        'image': 'img',
+        'link': 'a[href]',
+    },
+    'ajio': {
+        'name': 'Ajio',
+        'url': 'https://www.ajio.com/search/?text={query}',
+        'item': '.item',
+        'title': '.nameCls',
+        'brand': '.brand',
+        'price': '.price',
+        'image': 'img',
+        'link': 'a[href]',
+    },
+    'snitch': dict(SHOPIFY_SELECTORS, name='Snitch', url='https://www.snitch.co.in/search?q={query}&type=product'),
+    'comicsense': dict(SHOPIFY_SELECTORS, name='Comicsense', url='https://comicsense.in/search?q={query}&type=product'),
+    'xenpachi': dict(SHOPIFY_SELECTORS, name='Xenpachi', url='https://www.xenpachi.in/search?q={query}&type=product'),
+}
+
+
+class SearchFailed(Exception):
+    """A store could not be searched; the message is meant to be shown to the user."""
+
+
+def normalize_query(query):
+    """Lower-case a query and collapse its whitespace, so equivalent searches share a cache entry."""
+    return re.sub(r'\s+', ' ', query or '').strip().lower()
+
+
+def store_search_url(store, query):
+    """The results page URL of `store` (a PRODUCT_STORES entry) for `query`."""
+    return store['url'].format(query=quote_plus(query), slug=quote(query.replace(' ', '-')))
+
+
+def web_url(url, base=None):
+    """
+    `url`, resolved against `base`, if it is an http(s) URL, else ''.
+
+    Product links and images come from store pages and form fields and are
+    rendered as href and src attributes, where a javascript: or data: URL
+    would run in the user's session.
+    """
+    url = (url or '').strip()
+    if url and base:
+        url = urljoin(base, url)
+    parts = urlsplit(url)
+    return url if parts.scheme in ('http', 'https') and parts.netloc else ''
+
+
+def _select_text(card, selector):
+    if not selector:
+        return ''
+    element = card.select_one(selector)
+    return ' '.join(element.get_text(' ', strip=True).split()) if element else ''
+
+
+def _select_attr(card, selector, *attrs):
+    element = card.select_one(selector) if selector else None
+    if element is None:
+        return ''
+    for attr in attrs:
+        value = element.get(attr)
+        if value:
+            # srcset holds "url width, url width"; take the first URL
+            return value.split(',')[0].split()[0] if attr.endswith('srcset') else value
+    return ''
+
+
+def parse_products(html, page_url, store, limit):
+    """
+    Extract up to `limit` products from a store's results page.
+
+    Runs in a parser worker process, so it only takes and returns plain data.
+
+    Returns:
+        list: Products as dicts with name, brand, price, image_url and link.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    products = []
+    for card in soup.select(store['item']):
+        name = _select_text(card, store.get('title'))
+        if not name:
+            continue
+        image = _select_attr(card, store.get('image', 'img'), 'src', 'data-src', 'srcset', 'data-srcset')
+        link = _select_attr(card, store.get('link', 'a[href]'), 'href')
+        products.append({
+            'name': name,
+            'brand': _select_text(card, store.get('brand')) or store['name'],
+            'price': _select_text(card, store.get('price')),
+            'image_url': web_url(image, page_url),
+            'link': web_url(link, page_url) or page_url,
+        })
+        if len(products) >= limit:
+            break
+    return products
+
+
+class ProductSearch:
+    """
+    Searches several stores for products at the same time.
+
+    Each store's results page is fetched on a thread through a pooled
+    requests.Session for that store, and parsed on a small process pool so
+    BeautifulSoup does not hold up the request threads. The searches of all
+    stores run concurrently under asyncio, so a search takes about as long as
+    the slowest store rather than the sum of all of them, and a store that
+    does not answer within SEARCH_TIMEOUT is reported as failed without
+    holding up the others.
+
+    Parsed results are cached per (store, normalized query) for
+    SEARCH_CACHE_TTL seconds. Failures are remembered for SEARCH_FAILURE_TTL
+    seconds, so a store that is down does not add its timeout to every
+    search in the meantime.
+
+    Configuration:
+        PRODUCT_STORES: Stores that can be searched, see DEFAULT_STORES.
+        SEARCH_TIMEOUT: Seconds allowed for fetching and parsing one store.
+        SEARCH_STORE_CONCURRENCY: Most requests in flight to one store from
+            this process, across all searches.
+        SEARCH_PARSE_WORKERS: Parser processes. 0 parses on the fetching thread.
+        SEARCH_RESULT_LIMIT: Most products kept per store.
+        SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL: Size and lifetime of the result cache.
+        SEARCH_FAILURE_TTL: Seconds a failed store search is not retried.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._sessions = {}
+        self._store_limits = {}
+        self._fetch_executor = None
+        self._parse_executor = None
+        self._cache = None
+        self._failures = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PRODUCT_STORES', DEFAULT_STORES)
+        app.config.setdefault('SEARCH_TIMEOUT', 8.0)
+        app.config.setdefault('SEARCH_STORE_CONCURRENCY', 4)
+        app.config.setdefault('SEARCH_PARSE_WORKERS', 2)
+        app.config.setdefault('SEARCH_RESULT_LIMIT', 24)
+        app.config.setdefault('SEARCH_CACHE_SIZE', 2048)
+        app.config.setdefault('SEARCH_CACHE_TTL', 900)
+        app.config.setdefault('SEARCH_FAILURE_TTL', 60)
+        app.extensions['product_search'] = self
+        self.app = app
+        self._cache = LRUCache(maxsize=app.config['SEARCH_CACHE_SIZE'], ttl=app.config['SEARCH_CACHE_TTL'])
+        self._failures = LRUCache(maxsize=app.config['SEARCH_CACHE_SIZE'], ttl=app.config['SEARCH_FAILURE_TTL'])
+
+    @property
+    def stores(self):
+        return self.app.config['PRODUCT_STORES']
+
+    def search(self, query, stores=None):
+        """
+        Search `stores` (all configured stores by default) for `query`.
+
+        Returns:
+            list: One dict per store, in the order given, with the store's
+            key and display name, its products, an error message or None,
+            and whether the products came from the cache.
+        """
+        query = normalize_query(query)
+        stores = list(stores or self.stores)
+        results = {}
+        for key in stores:
+            products = self._cache.get((key, query))
+            if products is not None:
+                results[key] = self._result(key, products, cached=True)
+                continue
+            error = self._failures.get((key, query))
+            if error is not None:
+                results[key] = self._result(key, (), error=error, cached=True)
+
+        missing = [key for key in stores if key not in results]
+        if missing:
+            for key, outcome in zip(missing, asyncio.run(self._search_all(missing, query))):
+                if isinstance(outcome, SearchFailed):
+                    self._failures.set((key, query), str(outcome))
+                    results[key] = self._result(key, (), error=str(outcome))
+                else:
+                    self._cache.set((key, query), outcome)
+                    results[key] = self._result(key, outcome)
+        return [results[key] for key in stores]
+
+    def _result(self, key, products, error=None, cached=False):
+        return {'store': key, 'name': self.stores[key]['name'], 'products': products, 'error': error, 'cached': cached}
+
+    async def _search_all(self, keys, query):
+        return await asyncio.gather(*(self._search_store(key, query) for key in keys))
+
+    async def _search_store(self, key, query):
+        timeout = self.app.config['SEARCH_TIMEOUT']
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        store = self.stores[key]
+        try:
+            html, page_url = await asyncio.wait_for(
+                loop.run_in_executor(self._get_fetch_executor(), self.fetch, key, query), timeout)
+            remaining = max(0.0, timeout - (time.monotonic() - started))
+            products = await asyncio.wait_for(self._parse(loop, html, page_url, store), remaining)
+        except asyncio.TimeoutError:
+            print(f"Searching {key} for '{query}' timed out after {timeout}s")
+            return SearchFailed(f"{store['name']} took too long to respond.")
+        except SearchFailed as e:
+            return e
+        except Exception as e:
+            print(f"Error searching {key} for '{query}': {e}")
+            return SearchFailed(f"{store['name']} could not be searched right now.")
+        return tuple(products)
+
+    def fetch(self, key, query):
+        """
+        Fetch a store's results page; blocks, so it runs on a fetch thread.
+
+        Returns:
+            tuple: The page HTML and its final URL.
+        """
+        import requests
+
+        store = self.stores[key]
+        timeout = self.app.config['SEARCH_TIMEOUT']
+        limit = self._store_limit(key)
+        if not limit.acquire(timeout=timeout):
+            raise SearchFailed(f"{store['name']} is busy; try again in a moment.")
+        try:
+            response = self._session(key).get(store_search_url(store, query), timeout=(min(3.05, timeout), timeout))
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Error fetching {key} for '{query}': {e}")
+            raise SearchFailed(f"{store['name']} could not be reached.")
+        finally:
+            limit.release()
+        return response.text, response.url
+
+    async def _parse(self, loop, html, page_url, store):
+        limit = self.app.config['SEARCH_RESULT_LIMIT']
+        if not self.app.config['SEARCH_PARSE_WORKERS']:
+            return await loop.run_in_executor(self._get_fetch_executor(), parse_products, html, page_url, store, limit)
+        try:
+            return await loop.run_in_executor(self._get_parse_executor(), parse_products, html, page_url, store, limit)
+        except BrokenProcessPool:
+            # A parser process died; start a fresh pool and retry once
+            self._shutdown_parse_executor()
+            return await loop.run_in_executor(self._get_parse_executor(), parse_products, html, page_url, store, limit)
+
+    def _session(self, key):
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.headers.update({'User-Agent': USER_AGENT, 'Accept-Language': 'en-IN,en;q=0.9'})
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.app.config['SEARCH_STORE_CONCURRENCY'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[key] = session
+            return session
+
+    def _store_limit(self, key):
+        with self._lock:
+            limit = self._store_limits.get(key)
+            if limit is None:
+                limit = self._store_limits[key] = threading.BoundedSemaphore(self.app.config['SEARCH_STORE_CONCURRENCY'])
+            return limit
+
+    def _get_fetch_executor(self):
+        with self._lock:
+            if self._fetch_executor is None:
+                workers = self.app.config['SEARCH_STORE_CONCURRENCY'] * max(1, len(self.stores))
+                self._fetch_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='product-search')
+            return self._fetch_executor
+
+    def _get_parse_executor(self):
+        with self._lock:
+            if self._parse_executor is None:
+                self._parse_executor = ProcessPoolExecutor(max_workers=self.app.config['SEARCH_PARSE_WORKERS'])
+            return self._parse_executor
+
+    def _shutdown_parse_executor(self):
+        with self._lock:
+            if self._parse_executor is not None:
+                self._parse_executor.shutdown(wait=False)
+                self._parse_executor = None
+
+    def cache_stats(self):
+        """Hit, miss and eviction counts of the result cache."""
+        return self._cache.stats()
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._failures.clear()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            for executor in (self._fetch_executor, self._parse_executor):
+                if executor is not None:
+                    executor.shutdown(wait=wait)
+            self._fetch_executor = self._parse_executor = None
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
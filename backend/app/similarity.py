@@ -0,0 +1,483 @@
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from .catalog import tokenize, split_recommendation_item
+
+# How often, in seconds, the index directory is checked for a rebuild.
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Buckets that the words of product names and recommendations are hashed into.
+WORD_DIM = 32
+
+# Colours with a feature of their own; others only count through the words
+# of product names.
+COLORS = (
+    'black', 'white', 'grey', 'navy', 'blue', 'teal', 'green', 'olive', 'emerald', 'yellow', 'mustard',
+    'orange', 'rust', 'red', 'burgundy', 'pink', 'purple', 'lavender', 'brown', 'beige', 'cream', 'gold',
+)
+
+# Colours that tend to flatter each skin tone from the photo analysis.
+SKIN_TONE_COLORS = {
+    'Fair': ('navy', 'burgundy', 'emerald', 'lavender', 'grey'),
+    'Medium': ('olive', 'teal', 'rust', 'cream', 'navy'),
+    'Olive': ('mustard', 'olive', 'burgundy', 'cream', 'brown'),
+    'Deep': ('white', 'yellow', 'emerald', 'orange', 'gold'),
+}
+
+# Words of items that suit each face shape from the photo analysis.
+FACE_SHAPE_TERMS = {
+    'Round': 'v neck angular long pendant structured',
+    'Square': 'round scoop soft wrap hoop',
+    'Oval': 'crew boat neck statement',
+    'Heart': 'sweetheart scoop neckline drop earring',
+}
+
+# Relative weight of each feature block in the similarity score.
+BLOCK_WEIGHTS = {'words': 1.0, 'category': 0.5, 'style': 0.5, 'color': 0.7}
+
+# Clusters probed per query; more is slower but closer to an exact search.
+# At 1M products (1000 clusters) 32 finds about 90% of the exact top 10 in
+# around 2ms, see benchmarks/bench_similarity.py.
+DEFAULT_NPROBE = 32
+
+# Rows scored per matrix product by exact searches.
+SEARCH_CHUNK_ROWS = 65536
+
+# Rows k-means is trained on; every row is then assigned to its nearest centroid.
+KMEANS_SAMPLE_SIZE = 100_000
+
+# Products shown as "recommended for you".
+ML_RECOMMENDATION_COUNT = 6
+
+
+def _hashed(term):
+    """The word bucket and sign of a term (signed feature hashing)."""
+    h = zlib.crc32(term.encode())
+    return h % WORD_DIM, 1.0 if h & 0x80000000 else -1.0
+
+
+class FeatureSpace:
+    """
+    Maps products and users to vectors in one space, so that a user's
+    affinity for a product is the dot product of their vectors.
+
+    A vector has four blocks: hashed words, one column per category, per
+    style tag and per colour. Each block is normalized and weighted by
+    BLOCK_WEIGHTS, and the whole vector is then normalized.
+    """
+
+    def __init__(self, categories, styles, colors=COLORS, word_dim=WORD_DIM):
+        self.categories = tuple(categories)
+        self.styles = tuple(styles)
+        self.colors = tuple(colors)
+        self.word_dim = word_dim
+        self._blocks = {}
+        start = 0
+        for block, size in [('words', word_dim), ('category', len(self.categories)),
+                            ('style', len(self.styles)), ('color', len(self.colors))]:
+            self._blocks[block] = (start, start + size)
+            start += size
+        self.dim = start
+        self._columns = {
+            'category': {c: i for i, c in enumerate(self.categories)},
+            'style': {s: i for i, s in enumerate(self.styles)},
+            'color': {c: i for i, c in enumerate(self.colors)},
+        }
+
+    @classmethod
+    def from_recommendation_data(cls, data):
+        categories = set()
+        styles = set()
+        for shape in data.get('body_shapes', {}).values():
+            for category, recs in shape.get('recommendations', {}).items():
+                categories.add(category)
+                for item in recs.get('do', []):
+                    if isinstance(item, dict):
+                        styles.update(item.get('style_tags', []))
+        return cls(sorted(categories), sorted(styles))
+
+    def to_dict(self):
+        return {'categories': self.categories, 'styles': self.styles, 'colors': self.colors, 'word_dim': self.word_dim}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['categories'], data['styles'], data['colors'], data['word_dim'])
+
+    def _entries(self, block, weighted_keys):
+        """(column, weight) pairs of a block for {key: weight}, skipping unknown keys."""
+        if block == 'words':
+            start = self._blocks['words'][0]
+            for term, weight in weighted_keys.items():
+                column, sign = _hashed(term)
+                yield start + column, sign * weight
+            return
+        start = self._blocks[block][0]
+        columns = self._columns[block]
+        for key, weight in weighted_keys.items():
+            column = columns.get(key.strip().lower())
+            if column is not None:
+                yield start + column, weight
+
+    def _fill(self, matrix, row, features):
+        for block, weighted_keys in features.items():
+            for column, weight in self._entries(block, weighted_keys):
+                matrix[row, column] += weight
+
+    def _normalize(self, matrix):
+        """Normalize and weight each block, then every row, in place."""
+        for block, (start, end) in self._blocks.items():
+            part = matrix[:, start:end]
+            norms = np.linalg.norm(part, axis=1, keepdims=True)
+            np.divide(part, norms, out=part, where=norms > 0)
+            part *= BLOCK_WEIGHTS[block]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    @staticmethod
+    def product_features(product):
+        return {
+            'words': dict.fromkeys(tokenize(product.get('name', '')), 1.0),
+            'category': {product['category']: 1.0} if product.get('category') else {},
+            'style': dict.fromkeys(product.get('style_tags', ()), 1.0),
+            'color': dict.fromkeys(product.get('colors', ()), 1.0),
+        }
+
+    def encode_products(self, products):
+        """A float32 matrix with one normalized row per product."""
+        products = list(products)
+        matrix = np.zeros((len(products), self.dim), np.float32)
+        for row, product in enumerate(products):
+            self._fill(matrix, row, self.product_features(product))
+        return self._normalize(matrix)
+
+    def encode_profile(self, profile):
+        """The normalized float32 vector of a user_profile() dict."""
+        vector = np.zeros((1, self.dim), np.float32)
+        self._fill(vector, 0, profile_features(profile))
+        return self._normalize(vector)[0]
+
+
+def profile_features(profile):
+    """
+    Weighted features of a user: the words of their recommended items count
+    for, and of the items to avoid against, a product's name words; styles
+    they are not shown and colours they avoid count against.
+    """
+    words = {}
+    for text in profile['dos']:
+        for term in tokenize(text):
+            words[term] = words.get(term, 0.0) + 1.0
+    for text in profile['donts']:
+        for term in tokenize(text):
+            words[term] = words.get(term, 0.0) - 0.5
+    for term in tokenize(FACE_SHAPE_TERMS.get(profile.get('face_shape'), '')):
+        words[term] = words.get(term, 0.0) + 0.5
+    for term in tokenize(profile.get('preferences', '')):
+        words[term] = words.get(term, 0.0) + 0.5
+
+    styles = {style: 1.0 for style in profile['styles']}
+    for style in profile.get('excluded_styles', ()):
+        styles.setdefault(style, -1.0)
+
+    colors = dict.fromkeys(SKIN_TONE_COLORS.get(profile.get('skin_tone'), ()), 0.5)
+    for color in profile.get('colors', ()):
+        colors[color] = 1.0
+    for color in profile.get('avoided_colors', ()):
+        colors[color] = -1.0
+
+    return {
+        'words': words,
+        'category': dict.fromkeys(profile['categories'], 1.0),
+        'style': styles,
+        'color': colors,
+    }
+
+
+def _split_list(text):
+    return [part.strip().lower() for part in (text or '').split(',') if part.strip()]
+
+
+def build_profile(recommendations, style_guide, face_shape=None, skin_tone=None):
+    """
+    The inputs of a user's vector, from their generate_recommendations()
+    result, style guide dict and latest photo analysis.
+    """
+    from .recommender import STYLE_LEVELS, allowed_styles_for
+
+    dos, donts, categories = [], [], []
+    for category, recs in recommendations.get('recommendations', {}).items():
+        categories.append(category)
+        dos.extend(split_recommendation_item(item)[0] for item in recs['do'])
+        donts.extend(recs['dont'])
+    styles = allowed_styles_for(style_guide.get('fashion_risk_tolerance', 'moderate'))
+    return {
+        'dos': dos,
+        'donts': donts,
+        'categories': categories,
+        'styles': styles,
+        'excluded_styles': sorted(set().union(*STYLE_LEVELS) - set(styles)),
+        'colors': _split_list(style_guide.get('preferred_colors')),
+        'avoided_colors': _split_list(style_guide.get('avoided_colors')),
+        'preferences': ' '.join(filter(None, [style_guide.get('fashion_preferences'), style_guide.get('lifestyle')])),
+        'face_shape': face_shape,
+        'skin_tone': skin_tone,
+    }
+
+
+def user_profile(user):
+    """build_profile() for a User, from their cached recommendations and latest analysed photo."""
+    from .history import latest_analysis
+    from .recommender import generate_recommendations
+
+    recommendations = generate_recommendations(user)
+    style_guide = json.loads(user.style_guide_data) if user.style_guide_data else {}
+    latest = latest_analysis(user)
+    return build_profile(recommendations, style_guide,
+                         face_shape=latest.face_shape if latest else None,
+                         skin_tone=latest.skin_tone if latest else None)
+
+
+class SimilarityIndex:
+    """
+    Product vectors grouped by k-means cluster (an inverted file index).
+
+    Rows are stored sorted by cluster, so each cluster is a contiguous slice
+    of the vector matrix. A query scores the centroids, then only the rows
+    of the `nprobe` best clusters, and picks the top k with argpartition.
+
+    The arrays are memory-mapped read-only from the index directory, so
+    every worker process on a host shares one copy through the page cache.
+    """
+
+    FILES = ('vectors.npy', 'ids.npy', 'centroids.npy', 'offsets.npy')
+
+    def __init__(self, path, space, vectors, ids, centroids, offsets, version=None):
+        self.path = path
+        self.space = space
+        self.vectors = vectors
+        self.ids = ids
+        self.centroids = centroids
+        self.offsets = offsets
+        self.version = version
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path):
+        meta_path = os.path.join(path, 'meta.json')
+        stat = os.stat(meta_path)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, name), mmap_mode='r') for name in cls.FILES]
+        return cls(path, FeatureSpace.from_dict(meta['space']), *arrays, version=(stat.st_ino, stat.st_mtime_ns))
+
+    def search(self, query, k=10, nprobe=DEFAULT_NPROBE, exclude=()):
+        """
+        The approximate top `k` products for a query vector.
+
+        Args:
+            query (ndarray): A vector from FeatureSpace.encode_profile().
+            k (int): Most results returned.
+            nprobe (int): Clusters searched.
+            exclude (set): Product ids to leave out.
+
+        Returns:
+            list: (product_id, score) pairs, best first.
+        """
+        query = np.asarray(query, np.float32)
+        n_clusters = len(self.centroids)
+        nprobe = min(nprobe, n_clusters)
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < n_clusters else range(n_clusters)
+
+        wanted = k + len(exclude)
+        scores, rows = [], []
+        for cluster in probes:
+            start, end = int(self.offsets[cluster]), int(self.offsets[cluster + 1])
+            if start == end:
+                continue
+            cluster_scores = self.vectors[start:end] @ query
+            if len(cluster_scores) > wanted:
+                best = np.argpartition(-cluster_scores, wanted - 1)[:wanted]
+                cluster_scores = cluster_scores[best]
+                best += start
+            else:
+                best = np.arange(start, end)
+            scores.append(cluster_scores)
+            rows.append(best)
+        if not scores:
+            return []
+        return self._top(np.concatenate(scores), np.concatenate(rows), k, exclude)
+
+    def search_exact(self, queries, k=10):
+        """
+        The exact top `k` products for each row of `queries`, scoring every
+        product in chunks of SEARCH_CHUNK_ROWS with one matrix product each.
+
+        Returns:
+            tuple: (rows, scores) arrays of shape (len(queries), k), best
+            first; rows index self.ids.
+        """
+        queries = np.atleast_2d(np.asarray(queries, np.float32))
+        k = min(k, len(self.ids))
+        best_scores = np.full((len(queries), k), -np.inf, np.float32)
+        best_rows = np.zeros((len(queries), k), np.int64)
+        for start in range(0, len(self.ids), SEARCH_CHUNK_ROWS):
+            chunk_scores = queries @ self.vectors[start:start + SEARCH_CHUNK_ROWS].T
+            chunk_rows = np.broadcast_to(np.arange(start, start + chunk_scores.shape[1]), chunk_scores.shape)
+            scores = np.concatenate([best_scores, chunk_scores], axis=1)
+            rows = np.concatenate([best_rows, chunk_rows], axis=1)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _top(self, scores, rows, k, exclude):
+        order = np.argsort(-scores, kind='stable')
+        results = []
+        for i in order:
+            product_id = str(self.ids[rows[i]])
+            if product_id in exclude:
+                continue
+            results.append((product_id, float(scores[i])))
+            if len(results) >= k:
+                break
+        return results
+
+
+def _kmeans(vectors, n_clusters, sample_size, seed):
+    """Centroids trained on a sample of the rows, and every row's cluster."""
+    from sklearn.cluster import MiniBatchKMeans
+
+    rng = np.random.default_rng(seed)
+    sample = vectors if len(vectors) <= sample_size else vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=4096, n_init=3, random_state=seed).fit(sample)
+    centroids = kmeans.cluster_centers_.astype(np.float32)
+    labels = np.concatenate([
+        np.argmax(vectors[start:start + SEARCH_CHUNK_ROWS] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), SEARCH_CHUNK_ROWS)
+    ]) if len(vectors) else np.zeros(0, np.int64)
+    return centroids, labels
+
+
+def build_index(products, path, space=None, n_clusters=None, sample_size=KMEANS_SAMPLE_SIZE, seed=0):
+    """
+    Encode `products` and write a SimilarityIndex to the directory `path`.
+
+    The index is written next to `path` and then moved into place, so
+    processes loading it never see a partly written one.
+
+    Args:
+        products (iterable): Product dicts as in the catalogue file.
+        path (str): The index directory.
+        space (FeatureSpace): Defaults to one built from the recommendation data.
+        n_clusters (int): Defaults to the square root of the product count.
+
+    Returns:
+        dict: Product and cluster counts.
+    """
+    if space is None:
+        from .recommender import load_recommendation_data
+        space = FeatureSpace.from_recommendation_data(load_recommendation_data())
+
+    ids, chunks, batch = [], [], []
+    for product in products:
+        ids.append(str(product['id']))
+        batch.append(product)
+        if len(batch) >= SEARCH_CHUNK_ROWS:
+            chunks.append(space.encode_products(batch))
+            batch = []
+    chunks.append(space.encode_products(batch))
+    vectors = np.concatenate(chunks)
+
+    n_clusters = max(1, min(len(ids), n_clusters or int(np.sqrt(len(ids)))))
+    if len(ids) > n_clusters:
+        centroids, labels = _kmeans(vectors, n_clusters, sample_size, seed)
+    else:
+        centroids, labels = vectors.copy(), np.arange(len(ids))
+    order = np.argsort(labels, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]).astype(np.int64)
+
+    building = path + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    arrays = [vectors[order], np.array(ids)[order] if ids else np.array([], 'U1'), centroids, offsets]
+    for name, array in zip(SimilarityIndex.FILES, arrays):
+        np.save(os.path.join(building, name), np.ascontiguousarray(array))
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump({'space': space.to_dict(), 'products': len(ids), 'clusters': len(centroids)}, f)
+
+    old = path + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(building, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return {'products': len(ids), 'clusters': len(centroids), 'dim': space.dim}
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_similarity_index(path):
+    """
+    Return the index at `path`, reloading it if it was rebuilt since it was
+    last checked, or None if it hasn't been built.
+    """
+    global _index, _index_checked_at
+    now = time.monotonic()
+    if _index is not None and _index.path == path and now - _index_checked_at < RELOAD_CHECK_INTERVAL:
+        return _index
+
+    with _index_lock:
+        try:
+            stat = os.stat(os.path.join(path, 'meta.json'))
+        except OSError:
+            _index = None
+        else:
+            if _index is None or _index.path != path or _index.version != (stat.st_ino, stat.st_mtime_ns):
+                try:
+                    _index = SimilarityIndex.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error: could not load similarity index from {path}: {e}")
+                    _index = None
+        _index_checked_at = now
+        return _index
+
+
+def ml_recommendations(user, index, catalog, limit=ML_RECOMMENDATION_COUNT, exclude=()):
+    """
+    The catalogue products closest to a user's profile.
+
+    Products removed from the catalogue since the index was built are
+    skipped.
+
+    Returns:
+        list: {'product', 'score'} dicts, best first.
+    """
+    profile = user_profile(user)
+    if not profile['dos']:
+        return []
+    query = index.space.encode_profile(profile)
+    results = []
+    for product_id, score in index.search(query, k=limit * 2, exclude=exclude):
+        # Ids are stored as strings, catalogue files may use numbers
+        product = catalog.get(product_id)
+        if product is None and product_id.isdigit():
+            product = catalog.get(int(product_id))
+        if product is not None:
+            results.append({'product': product, 'score': score})
+            if len(results) >= limit:
+                break
+    return results
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+# Longest side, in pixels, of each thumbnail size. Sized for 2x displays:
+# small for the history grid and dashboard, medium for the result page.
+THUMBNAIL_SIZES = {
+    'small': 320,
+    'medium': 640,
+}
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+THUMBNAIL_DIR = 'thumbs'
+
+
+def thumbnail_path(upload_folder, filename, size, fmt):
+    """Where the thumbnail of `filename` is stored, next to the originals."""
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(upload_folder, THUMBNAIL_DIR, f'{stem}-{size}.{fmt}')
+
+
+def make_thumbnail(source_path, target_path, max_side, fmt):
+    """
+    Write a downscaled copy of the image at `source_path` to `target_path`.
+
+    JPEGs are decoded at a reduced scale straight away (Pillow's draft mode),
+    so a 12 MP photo never needs to be decoded at full size. The file is
+    written under a temporary name and renamed, so a thumbnail that exists is
+    always complete.
+    """
+    from PIL import Image, ImageOps
+
+    pil_format, _, save_options = THUMBNAIL_FORMATS[fmt]
+    with Image.open(source_path) as image:
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+        if image.mode not in ('RGB', 'RGBA') or fmt == 'jpg':
+            image = image.convert('RGB')
+
+        directory = os.path.dirname(target_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, pil_format, **save_options)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def get_thumbnail(upload_folder, filename, size, fmt):
+    """
+    Path of a thumbnail of an uploaded image, generating it on first use.
+
+    Args:
+        upload_folder (str): Directory holding the originals.
+        filename (str): The stored name of the original.
+        size (str): A key of THUMBNAIL_SIZES.
+        fmt (str): A key of THUMBNAIL_FORMATS.
+
+    Returns:
+        str: The thumbnail's path, or None if there is no such original.
+    """
+    source_path = os.path.join(upload_folder, filename)
+    target_path = thumbnail_path(upload_folder, filename, size, fmt)
+    if os.path.exists(target_path):
+        return target_path
+    if not os.path.isfile(source_path):
+        return None
+    make_thumbnail(source_path, target_path, THUMBNAIL_SIZES[size], fmt)
+    return target_path
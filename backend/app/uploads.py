@@ -0,0 +1,109 @@
+import hashlib
+import os
+import tempfile
+import warnings
+from itertools import chain
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the formats we accept, and the extension they are stored under.
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'\xff\xd8\xff': 'jpg',
+}
+PIL_FORMATS = ['PNG', 'JPEG']
+
+
+class UploadRejected(ValueError):
+    """The upload was refused; the message is meant to be shown to the user."""
+
+
+def sniff_image_type(header):
+    """The stored extension for an image starting with `header`, or None."""
+    for signature, ext in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return ext
+    return None
+
+
+def read_image_size(path):
+    """
+    Read an image's (width, height) from its header without decoding it.
+
+    Raises:
+        UploadRejected: If the header cannot be parsed as PNG or JPEG.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with warnings.catch_warnings():
+            # Size limits are enforced by the caller
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(path, formats=PIL_FORMATS) as image:
+                return image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected('That image has too many pixels.')
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise UploadRejected('That file does not look like a valid PNG or JPEG image.')
+
+
+def save_upload(file, upload_folder, max_bytes=None, max_pixels=None):
+    """
+    Validate an uploaded image and store it under the SHA-256 of its content.
+
+    The upload is streamed to a temporary file in `upload_folder` in chunks
+    while it is hashed. The first chunk must start with a PNG or JPEG
+    signature, the stream is cut off as soon as it exceeds `max_bytes`, and
+    the dimensions are read from the header and checked against `max_pixels`
+    before anything decodes the image. Only then is the file renamed to
+    ``<sha256>.<ext>``. If a file with that name already exists the copy is
+    discarded, so identical uploads share one file on disk.
+
+    Args:
+        file (FileStorage): The uploaded file from ``request.files``.
+        upload_folder (str): Directory the upload is stored in.
+        max_bytes (int): Largest accepted file size, or None for no limit.
+        max_pixels (int): Largest accepted width * height, or None for no limit.
+
+    Returns:
+        tuple: The stored filename and the hex content hash.
+
+    Raises:
+        UploadRejected: If the file is not an acceptable image.
+    """
+    os.makedirs(upload_folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            first = file.stream.read(CHUNK_SIZE)
+            ext = sniff_image_type(first)
+            if ext is None:
+                raise UploadRejected('Only PNG and JPEG images can be analyzed.')
+
+            for chunk in chain([first], iter(lambda: file.stream.read(CHUNK_SIZE), b'')):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadRejected(f'That image is too large; the limit is {max_bytes // (1024 * 1024)} MB.')
+                digest.update(chunk)
+                out.write(chunk)
+
+        width, height = read_image_size(tmp_path)
+        if max_pixels is not None and width * height > max_pixels:
+            raise UploadRejected(f'That image is too large ({width}x{height} pixels).')
+
+        content_hash = digest.hexdigest()
+        filename = f'{content_hash}.{ext}'
+        filepath = os.path.join(upload_folder, filename)
+        if os.path.exists(filepath):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return filename, content_hash
+
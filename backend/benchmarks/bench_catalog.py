@@ -0,0 +1,139 @@
+"""
+Matching recommendation items to products in a large catalogue.
+
+Builds a synthetic catalogue whose product names reuse the words of the
+recommendation data, so every recommended item has plenty of candidates,
+and compares CatalogIndex lookups with scanning every product. Also times
+building the index and applying a batch of appended catalogue lines.
+
+    python -m benchmarks.bench_catalog [--products 100000]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+COLORS = ['black', 'white', 'navy', 'olive', 'burgundy', 'beige', 'grey', 'mustard', 'teal', 'rust']
+STYLES = ['classic', 'trendy', 'adventurous']
+MODIFIERS = ['cotton', 'linen', 'stretch', 'relaxed', 'premium', 'everyday', 'printed', 'textured', 'ribbed', 'satin']
+
+
+def recommendation_items():
+    """Every (category, item) pair in the recommendation data."""
+    from app.recommender import load_recommendation_data
+
+    items = set()
+    for shape in load_recommendation_data().get('body_shapes', {}).values():
+        for category, recs in shape.get('recommendations', {}).items():
+            for entry in recs.get('do', []):
+                items.add((category, entry['item'] if isinstance(entry, dict) else entry))
+    return sorted(items)
+
+
+def synthetic_products(n, seed=0):
+    """Generate `n` product dicts named after recommendation items."""
+    rng = random.Random(seed)
+    items = recommendation_items()
+    for i in range(n):
+        category, item = rng.choice(items)
+        yield {
+            'id': f'p{i}',
+            'name': f'{rng.choice(MODIFIERS).title()} {item} {rng.randrange(1000)}',
+            'brand': f'Brand {rng.randrange(200)}',
+            'category': category,
+            'colors': rng.sample(COLORS, rng.randint(1, 3)),
+            'style_tags': rng.sample(STYLES, rng.randint(1, 2)),
+            'price': f'Rs. {rng.randrange(499, 4999)}',
+            'link': f'https://example.com/products/{i}',
+            'popularity': rng.random(),
+        }
+
+
+def synthetic_catalog(n, seed=0):
+    """`n` product dicts named after recommendation items, as a list."""
+    return list(synthetic_products(n, seed))
+
+
+def linear_match(products, text, color, styles, category, limit):
+    """The baseline: score every product and keep the best."""
+    from app.catalog import tokenize, CatalogIndex
+
+    wanted = set(tokenize(text))
+    allowed = set(styles)
+    found = []
+    for product in products:
+        terms = CatalogIndex.product_terms(product)
+        if not wanted <= terms or not allowed.intersection(product['style_tags']):
+            continue
+        if product['category'] != category:
+            continue
+        found.append((color not in product['colors'], -product['popularity'], product['id'], product))
+    found.sort(key=lambda entry: entry[:3])
+    return [entry[-1] for entry in found[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--appended', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    from app.catalog import CatalogIndex, split_recommendation_item
+
+    products = synthetic_catalog(args.products)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'product_catalog.jsonl')
+        with open(path, 'w') as f:
+            for product in products:
+                f.write(json.dumps(product) + '\n')
+
+        started = time.perf_counter()
+        catalog = CatalogIndex.from_file(path)
+        build = time.perf_counter() - started
+
+        rng = random.Random(1)
+        queries = [
+            (category, item + (f' (consider in {rng.choice(COLORS)})' if rng.random() < 0.5 else ''), rng.choice(STYLES[:2]))
+            for category, item in rng.choices(recommendation_items(), k=args.queries)
+        ]
+        index_timings = []
+        for category, item, style in queries:
+            text, color = split_recommendation_item(item)
+            started = time.perf_counter()
+            catalog.match(text, color=color, styles=(style,), category=category)
+            index_timings.append(time.perf_counter() - started)
+
+        scan_timings = []
+        for category, item, style in queries[:10]:
+            text, color = split_recommendation_item(item)
+            started = time.perf_counter()
+            linear_match(products, text, color, (style,), category, 3)
+            scan_timings.append(time.perf_counter() - started)
+
+        # Appended lines: half of them replace existing products, the rest are new
+        updates = synthetic_catalog(args.appended, seed=2)
+        for i, product in enumerate(updates):
+            product['id'] = f'p{i * 2}' if i % 2 else f'new{i}'
+        with open(path, 'a') as f:
+            for product in updates:
+                f.write(json.dumps(product) + '\n')
+        started = time.perf_counter()
+        catalog.apply_file_changes()
+        append = time.perf_counter() - started
+
+    print(f'{args.products} products, {len(catalog)} after {args.appended} appended lines')
+    print(f'  build index from file      {build * 1000:>10.1f} ms')
+    print(f'  apply appended lines       {append * 1000:>10.1f} ms')
+    print(f"  {'match one item':<26} {'median ms':>10} {'p99 ms':>10}")
+    for name, timings in [('inverted index', index_timings), ('linear scan', scan_timings)]:
+        timings = sorted(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f'  {name:<26} {statistics.median(timings) * 1000:>10.3f} {p99 * 1000:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
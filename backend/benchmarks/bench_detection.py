@@ -0,0 +1,87 @@
+"""
+Accuracy vs latency of downscaled face detection.
+
+Runs detect_face_with_multiple_methods over synthetic faces at several upload
+resolutions, once at full resolution and once per working resolution, and
+reports the median detection time, how many faces were found and how well the
+rectangles agree with the full-resolution result (IoU).
+
+    python -m benchmarks.bench_detection [--repeat 3]
+"""
+import argparse
+import statistics
+import time
+
+import cv2
+
+from app.analysis import detect_face_with_multiple_methods
+from app.detectors import warm_up
+from .synthetic import synthetic_face
+
+RESOLUTIONS = [(1280, 960), (2592, 1944), (4032, 3024)]
+FACE_FRACTIONS = [0.7, 0.4, 0.2]
+MAX_DIMS = [None, 1280, 800, 640, 480, 320]
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def run(repeat=3, seeds=4):
+    warm_up()
+    samples = []
+    for width, height in RESOLUTIONS:
+        for fraction in FACE_FRACTIONS:
+            for seed in range(seeds):
+                img, _ = synthetic_face(width, height, face_fraction=fraction, seed=seed)
+                samples.append(((width, height), img, cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)))
+
+    reference = {}
+    results = []
+    for max_dim in MAX_DIMS:
+        for resolution in RESOLUTIONS:
+            timings, found, overlaps = [], 0, []
+            for index, (size, img, gray) in enumerate(samples):
+                if size != resolution:
+                    continue
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    face = detect_face_with_multiple_methods(img, gray, max_dim)
+                    timings.append(time.perf_counter() - started)
+                if max_dim is None:
+                    reference[index] = face
+                if face is not None:
+                    found += 1
+                    if reference.get(index) is not None:
+                        overlaps.append(iou(face, reference[index]))
+            results.append({
+                'max_dim': max_dim or 'full',
+                'resolution': f'{resolution[0]}x{resolution[1]}',
+                'median_ms': statistics.median(timings) * 1000,
+                'found': found,
+                'images': len(timings) // repeat,
+                'mean_iou': statistics.mean(overlaps) if overlaps else 0.0,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seeds', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'max_dim':>8} {'resolution':>10} {'median ms':>10} {'found':>7} {'IoU vs full':>12}")
+    for row in run(args.repeat, args.seeds):
+        print(f"{row['max_dim']:>8} {row['resolution']:>10} {row['median_ms']:>10.1f} "
+              f"{row['found']:>3}/{row['images']:<3} {row['mean_iou']:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Latency vs accuracy of dominant colour extraction.
+
+Runs extract_dominant_colors over synthetic images with known colour blocks
+for several sampling and quantization settings, and reports the median and
+worst time per image and the palette error: the share-weighted distance, in
+RGB units, from each true colour to the closest extracted colour.
+
+    python -m benchmarks.bench_palette [--repeat 5]
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.analysis import PALETTE_TIME_BUDGET, extract_dominant_colors
+from .synthetic import synthetic_palette_image
+
+RESOLUTIONS = [(1280, 960), (4032, 3024)]
+SAMPLE_PIXELS = [4096, 16384, 65536, None]
+QUANT_BITS = [3, 4, 5]
+
+
+def random_colors(rng, count):
+    shares = rng.dirichlet(np.ones(count) * 2)
+    return [(tuple(int(v) for v in rng.integers(0, 256, 3)), float(share)) for share in shares]
+
+
+def palette_error(colors, palette):
+    extracted = np.array([[int(c['hex'][i:i + 2], 16) for i in (5, 3, 1)] for c in palette], float)
+    error = 0.0
+    for bgr, share in colors:
+        error += share * np.sqrt(((extracted - np.array(bgr, float)) ** 2).sum(axis=1)).min()
+    return error
+
+
+def run(repeat=5, images=6):
+    rng = np.random.default_rng(0)
+    samples = []
+    for width, height in RESOLUTIONS:
+        for seed in range(images):
+            colors = random_colors(rng, int(rng.integers(3, 6)))
+            samples.append(((width, height), colors, synthetic_palette_image(width, height, colors, seed)))
+
+    results = []
+    for max_pixels in SAMPLE_PIXELS:
+        for bits in QUANT_BITS:
+            for resolution in RESOLUTIONS:
+                timings, errors = [], []
+                for size, colors, img in samples:
+                    if size != resolution:
+                        continue
+                    pixels = max_pixels or img.shape[0] * img.shape[1]
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        palette = extract_dominant_colors(img, max_pixels=pixels, bits=bits)
+                        timings.append(time.perf_counter() - started)
+                    errors.append(palette_error(colors, palette))
+                results.append({
+                    'sample_pixels': max_pixels or 'all',
+                    'bits': bits,
+                    'resolution': f'{resolution[0]}x{resolution[1]}',
+                    'median_ms': statistics.median(timings) * 1000,
+                    'max_ms': max(timings) * 1000,
+                    'error': statistics.mean(errors),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--images', type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"k-means time budget: {PALETTE_TIME_BUDGET * 1000:.0f}ms")
+    print(f"{'samples':>8} {'bits':>4} {'resolution':>10} {'median ms':>10} {'max ms':>8} {'error':>7}")
+    for row in run(args.repeat, args.images):
+        print(f"{row['sample_pixels']:>8} {row['bits']:>4} {row['resolution']:>10} "
+              f"{row['median_ms']:>10.2f} {row['max_ms']:>8.2f} {row['error']:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
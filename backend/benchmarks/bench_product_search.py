@@ -0,0 +1,81 @@
+"""
+Latency of product search across several stores.
+
+Runs against the local fixture server, with each store answering after a
+different delay, once with every store responsive and once with a store
+that is slower than the search timeout. Compares fetching and parsing the
+stores one after another with ProductSearch's concurrent search, cold and
+from the cache.
+
+    python -m benchmarks.bench_product_search [--repeat 5]
+"""
+import argparse
+import statistics
+import time
+
+from .fixture_store import fixture_stores, start_server
+
+STORE_DELAYS = {'alpha': 0.08, 'beta': 0.15, 'gamma': 0.25, 'delta': 0.12, 'epsilon': 0.3}
+STALLED_STORE = {'stalled': 5.0}
+TIMEOUT = 1.0
+
+
+def make_search(base_url, delays):
+    from flask import Flask
+
+    from app.scraper import ProductSearch
+
+    app = Flask(__name__)
+    app.config.update(PRODUCT_STORES=fixture_stores(base_url, delays), SEARCH_TIMEOUT=TIMEOUT)
+    return ProductSearch(app)
+
+
+def sequential_search(search, query):
+    """The baseline: fetch and parse each store in turn, skipping failures."""
+    from app.scraper import SearchFailed, parse_products
+
+    results = []
+    for key in search.stores:
+        try:
+            html, page_url = search.fetch(key, query)
+        except SearchFailed:
+            continue
+        results.append(parse_products(html, page_url, search.stores[key], search.app.config['SEARCH_RESULT_LIMIT']))
+    return results
+
+
+def timed(func, repeat):
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    server, base_url = start_server()
+    for scenario, delays in [('all stores up', STORE_DELAYS), ('one store stalled', {**STORE_DELAYS, **STALLED_STORE})]:
+        search = make_search(base_url, delays)
+        # Start the parser processes before timing anything
+        search.search('warm up')
+
+        print(f'{scenario}: store delays {sorted(delays.values())}s, timeout {TIMEOUT}s')
+        print(f"  {'mode':<26} {'median ms':>10} {'max ms':>10}")
+        rows = [
+            ('sequential', lambda i: sequential_search(search, f'sequential {i}')),
+            ('concurrent, cold cache', lambda i: search.search(f'concurrent {i}')),
+            ('concurrent, cached', lambda i: search.search('concurrent 0')),
+        ]
+        for name, func in rows:
+            median, worst = timed(func, args.repeat)
+            print(f'  {name:<26} {median:>10.1f} {worst:>10.1f}')
+        search.shutdown(wait=False)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Top-k latency and memory of the product similarity index.
+
+Builds an index over a synthetic catalogue, then times queries for random
+user profiles with the clustered search at several `nprobe` values and
+with the exact chunked search. Recall is the share of results scoring at
+least as high as the exact 10th result; the synthetic products tie often,
+so comparing ids would understate it.
+
+Finally forks worker processes that each load the index and run queries,
+and reports how much of their memory is private (anonymous) rather than
+shared through the page cache.
+
+    python -m benchmarks.bench_similarity [--items 1000000]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+from .bench_catalog import synthetic_products
+
+BODY_SHAPES = ['Pear', 'Rectangle', 'Apple', 'Hourglass', 'Inverted Triangle']
+RISK_TOLERANCES = ['conservative', 'moderate', 'adventurous']
+COLORS = ['navy', 'olive', 'burgundy', 'black', 'teal', '']
+FACE_SHAPES = ['Round', 'Square', 'Oval', 'Heart', None]
+SKIN_TONES = ['Fair', 'Medium', 'Olive', 'Deep', None]
+
+
+def random_profiles(n, seed=0):
+    """Query vectors for `n` random users."""
+    from app.recommender import build_recommendations
+    from app.similarity import build_profile
+
+    rng = random.Random(seed)
+    profiles = []
+    for _ in range(n):
+        style_guide = {
+            'fashion_risk_tolerance': rng.choice(RISK_TOLERANCES),
+            'preferred_colors': rng.choice(COLORS),
+            'avoided_colors': rng.choice(COLORS),
+        }
+        user = SimpleNamespace(body_shape=rng.choice(BODY_SHAPES), style_guide_data=json.dumps(style_guide))
+        profiles.append(build_profile(build_recommendations(user), style_guide,
+                                      face_shape=rng.choice(FACE_SHAPES), skin_tone=rng.choice(SKIN_TONES)))
+    return profiles
+
+
+def memory_kb():
+    """(anonymous, file-backed) resident memory of this process, in KiB."""
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('RssAnon', 'RssFile'):
+                fields[name] = int(value.split()[0])
+    return fields.get('RssAnon', 0), fields.get('RssFile', 0)
+
+
+def worker(path, queries, results):
+    from app.similarity import SimilarityIndex
+
+    anon, file = memory_kb()
+    index = SimilarityIndex.load(path)
+    for query in queries:
+        index.search(query, k=10)
+    index.search_exact(queries[:4], k=10)
+    anon_after, file_after = memory_kb()
+    results.put((anon_after - anon, file_after - file))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from app.similarity import SimilarityIndex, build_index
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'similarity_index')
+        started = time.perf_counter()
+        stats = build_index(synthetic_products(args.items), path)
+        build = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+        index = SimilarityIndex.load(path)
+        queries = np.stack([index.space.encode_profile(p) for p in random_profiles(args.queries)])
+        _, exact_scores = index.search_exact(queries, k=10)
+        cutoffs = exact_scores[:, -1] - 1e-6
+
+        print(f"{stats['products']} products, {stats['clusters']} clusters, {stats['dim']} features, "
+              f"{size / 2**20:.0f} MiB on disk, built in {build:.1f}s")
+        print(f"  {'top 10':<26} {'median ms':>10} {'p99 ms':>10} {'recall':>8}")
+        for nprobe in (4, 8, 16, 32):
+            timings, recall = [], []
+            for query, cutoff in zip(queries, cutoffs):
+                started = time.perf_counter()
+                found = index.search(query, k=10, nprobe=nprobe)
+                timings.append(time.perf_counter() - started)
+                recall.append(sum(score >= cutoff for _, score in found) / 10)
+            timings.sort()
+            print(f"  {f'clustered, nprobe {nprobe}':<26} {statistics.median(timings) * 1000:>10.2f} "
+                  f"{timings[int(len(timings) * 0.99)] * 1000:>10.2f} {statistics.mean(recall):>8.3f}")
+
+        timings = []
+        for query in queries[:20]:
+            started = time.perf_counter()
+            index.search_exact(query, k=10)
+            timings.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        index.search_exact(queries, k=10)
+        batched = (time.perf_counter() - started) / len(queries)
+        print(f"  {'exact':<26} {statistics.median(timings) * 1000:>10.2f} {max(timings) * 1000:>10.2f} {1:>8.3f}")
+        print(f"  {f'exact, batch of {len(queries)}':<26} {batched * 1000:>10.2f} {'per query':>10}")
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(path, list(queries), results)) for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print(f"  vectors: {index.vectors.nbytes / 2**20:.0f} MiB; memory added per worker after loading and querying:")
+        for i in range(args.workers):
+            anon, file = results.get()
+            print(f"    worker {i}: {anon / 1024:.1f} MiB private, {file / 1024:.1f} MiB shared page cache")
+
+
+if __name__ == '__main__':
+    main()
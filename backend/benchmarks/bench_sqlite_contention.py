@@ -0,0 +1,151 @@
+"""
+SQLite write contention between analysis results and request traffic.
+
+Writer threads deliver finished analysis results through AnalysisQueue, the
+way the process pool's callbacks do, while reader threads run the login and
+dashboard queries in a loop. Each configuration gets a fresh database file and
+reports how fast results were committed, how many were lost to
+"database is locked", and the read throughput and p95 latency alongside.
+
+    python -m benchmarks.bench_sqlite_contention [--writers 8] [--readers 8] [--results 200]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+CONFIGURATIONS = [
+    ('rollback journal, commit per result', {
+        'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'ANALYSIS_WRITE_BATCH_SIZE': 1}),
+    ('WAL, commit per result', {
+        'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'ANALYSIS_WRITE_BATCH_SIZE': 1}),
+    ('WAL, batched writes', {
+        'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'ANALYSIS_WRITE_BATCH_SIZE': 50}),
+]
+
+RESULT = {
+    'face_shape': 'Oval',
+    'skin_tone': 'Medium',
+    'dominant_colors': [{'hex': '#aa8866', 'ratio': 0.5}, {'hex': '#223344', 'ratio': 0.5}],
+    'timings': {},
+}
+
+
+def make_app(tmp, overrides, users, images_per_user):
+    from app import create_app, database, db
+    from app.models import User, UserImage
+
+    config = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'contention.sqlite'),
+        'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+        'METRICS_ENABLED': False,
+    }
+    config.update(overrides)
+    app = create_app(config)
+    database.create_schema(app, db)
+    with app.app_context():
+        for i in range(users):
+            user = User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add_all(UserImage(user_id=user.id, filename=f'{i}-{j}.jpg') for j in range(images_per_user))
+        db.session.commit()
+    return app
+
+
+def run_configuration(name, overrides, writers, readers, results_per_writer, users=50):
+    from app import db
+    from app.jobs import AnalysisQueue
+    from app.models import User, UserImage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images_per_user = -(-writers * results_per_writer // users)
+        app = make_app(tmp, overrides, users, images_per_user)
+        queue = AnalysisQueue(app)
+        image_ids = list(range(1, writers * results_per_writer + 1))
+
+        stop = threading.Event()
+        read_latencies = []
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+
+        def read_loop(seed):
+            i = seed
+            with app.app_context():
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        user = User.query.filter_by(email=f'user{i % users}@example.com').first()
+                        UserImage.query.filter_by(user_id=user.id).order_by(UserImage.upload_date.desc()).all()
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        with lock:
+                            errors['read'] += 1
+                        continue
+                    finally:
+                        i += 1
+                    with lock:
+                        read_latencies.append(time.perf_counter() - started)
+
+        def write_loop(ids):
+            for image_id in ids:
+                future = Future()
+                future.set_result(RESULT)
+                try:
+                    queue._on_done(image_id, f'{image_id:064x}', future)
+                except Exception:
+                    with lock:
+                        errors['write'] += 1
+
+        reader_threads = [threading.Thread(target=read_loop, args=(i,)) for i in range(readers)]
+        writer_threads = [
+            threading.Thread(target=write_loop, args=(image_ids[i::writers],)) for i in range(writers)]
+        for thread in reader_threads:
+            thread.start()
+        started = time.perf_counter()
+        for thread in writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        queue.flush()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in reader_threads:
+            thread.join()
+
+        with app.app_context():
+            stored = UserImage.query.filter_by(analysis_complete=True).count()
+            db.engine.dispose()
+
+    read_latencies.sort()
+    return {
+        'name': name,
+        'writes_per_sec': stored / elapsed,
+        'lost_writes': len(image_ids) - stored,
+        'reads_per_sec': len(read_latencies) / elapsed,
+        'read_p50_ms': statistics.median(read_latencies) * 1000 if read_latencies else float('nan'),
+        'read_p95_ms': read_latencies[int(len(read_latencies) * 0.95)] * 1000 if read_latencies else float('nan'),
+        'read_errors': errors['read'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--results', type=int, default=200, help='Results delivered by each writer thread.')
+    args = parser.parse_args()
+
+    print(f"{'configuration':<38} {'writes/s':>9} {'lost':>6} {'reads/s':>9} {'read p50':>9} {'read p95':>9} {'read err':>9}")
+    for name, overrides in CONFIGURATIONS:
+        r = run_configuration(name, overrides, args.writers, args.readers, args.results)
+        print(f"{r['name']:<38} {r['writes_per_sec']:>9.0f} {r['lost_writes']:>6} {r['reads_per_sec']:>9.0f} "
+              f"{r['read_p50_ms']:>7.2f}ms {r['read_p95_ms']:>7.2f}ms {r['read_errors']:>9}")
+
+
+if __name__ == '__main__':
+    main()
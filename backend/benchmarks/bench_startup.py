@@ -0,0 +1,115 @@
+"""
+App startup cost: import time per module, boot time and worker memory.
+
+Boots the app in fresh interpreters under `python -X importtime`, with
+OpenCV loaded lazily (the default) and preloaded (PRELOAD_ANALYSIS), and
+reports the import time of each package, the time to create the app and the
+resident memory afterwards. Each booted process then forks a worker that
+runs the analysis imports, as the first upload would, and reports the
+memory that worker does not share with its parent.
+
+    python -m benchmarks.bench_startup [--top 12] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FORK_MARKER = '--- fork ---'
+
+BOOT_SCRIPT = r'''
+import json, os, sys, time
+FORK_MARKER = %(marker)r
+started = time.perf_counter()
+from app import create_app
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'PRELOAD_ANALYSIS': %(preload)r})
+boot = time.perf_counter() - started
+
+def private_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith(('Private_Clean', 'Private_Dirty')))
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+
+heavy = [name for name in ('cv2', 'numpy', 'PIL', 'bs4', 'requests', 'sklearn') if name in sys.modules]
+# Imports after this line are the worker's, not the boot's
+print(FORK_MARKER, file=sys.stderr, flush=True)
+read_end, write_end = os.pipe()
+if os.fork() == 0:
+    started = time.perf_counter()
+    from app import analysis, detectors
+    detectors.warm_up()
+    first_analysis = time.perf_counter() - started
+    os.write(write_end, json.dumps([first_analysis, private_kb()]).encode())
+    os._exit(0)
+os.close(write_end)
+first_analysis, worker_private = json.loads(os.read(read_end, 1 << 16))
+os.wait()
+print(json.dumps({'boot': boot, 'rss': rss_kb(), 'heavy': heavy,
+                  'first_analysis': first_analysis, 'worker_private': worker_private}))
+'''
+
+
+def parse_importtime(stderr):
+    """{top-level package: microseconds} spent importing its own modules."""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+    return packages
+
+
+def nested_importtime(stderr, names):
+    """Cumulative microseconds of `names`, including what they import."""
+    found = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line.split('|')
+            if name.strip() in names:
+                found[name.strip()] = int(cumulative)
+    return found
+
+
+def boot(preload):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=backend)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-W', 'ignore', '-c', BOOT_SCRIPT % {'preload': preload, 'marker': FORK_MARKER}],
+        cwd=backend, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.splitlines()[-1]), completed.stderr.split(FORK_MARKER)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--top', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for preload in (False, True):
+        runs = [boot(preload) for _ in range(args.repeat)]
+        results = [result for result, _ in runs]
+        stderr = runs[-1][1]
+        print(f"PRELOAD_ANALYSIS={preload}")
+        print(f"  create_app               {statistics.median(r['boot'] for r in results) * 1000:>8.0f} ms")
+        print(f"  resident memory          {statistics.median(r['rss'] for r in results) / 1024:>8.1f} MiB")
+        print(f"  heavy modules loaded     {', '.join(results[-1]['heavy']) or 'none'}")
+        print(f"  first analysis, worker   {statistics.median(r['first_analysis'] for r in results) * 1000:>8.0f} ms")
+        print(f"  worker private memory    {statistics.median(r['worker_private'] for r in results) / 1024:>8.1f} MiB")
+        print("  import time by package (ms, own modules only):")
+        for name, micros in sorted(parse_importtime(stderr).items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:<32} {micros / 1000:>8.1f}")
+        for name, micros in sorted(nested_importtime(stderr, ('cv2', 'numpy', 'flask', 'sqlalchemy')).items()):
+            print(f"    {name + ', cumulative':<32} {micros / 1000:>8.1f}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
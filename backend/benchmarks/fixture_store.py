@@ -0,0 +1,98 @@
+"""
+A local HTTP server that imitates store search pages, for benchmarks and
+manual testing of product search without reaching the real stores.
+
+Every store is served under its own path prefix and answers after its own
+delay, so slow and unresponsive stores can be simulated:
+
+    python -m benchmarks.fixture_store --port 8765
+
+and then, in the app config:
+
+    PRODUCT_STORES = fixture_stores('http://127.0.0.1:8765', {'fast': 0.05, 'slow': 0.4})
+"""
+import argparse
+import html
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PRODUCTS_PER_PAGE = 40
+
+
+def render_results_page(store, query, count=PRODUCTS_PER_PAGE):
+    """A Shopify-style results page with `count` product cards."""
+    cards = []
+    for i in range(count):
+        name = html.escape(f'{query.title()} {store.title()} Edition {i + 1}')
+        cards.append(f'''
+        <div class="card-wrapper product-card-wrapper">
+          <div class="card">
+            <div class="card__media"><img src="/{store}/images/{i}.jpg" srcset="/{store}/images/{i}.jpg 360w, /{store}/images/{i}-2x.jpg 720w" alt="{name}" loading="lazy"></div>
+            <div class="card__content">
+              <h3 class="card__heading"><a href="/{store}/products/{i}" class="full-unstyled-link">{name}</a></h3>
+              <div class="price"><span class="price-item price-item--regular">Rs. {999 + i * 50}.00</span></div>
+            </div>
+          </div>
+        </div>''')
+    filler = '<p>' + 'Free shipping on orders above Rs. 999. ' * 40 + '</p>'
+    return (f'<!doctype html><html><head><title>Search: {html.escape(query)}</title></head><body>'
+            f'<header>{filler}</header><main><div id="product-grid">{"".join(cards)}</div></main>'
+            f'<footer>{filler}</footer></body></html>')
+
+
+def fixture_stores(base_url, delays):
+    """PRODUCT_STORES entries pointing at a fixture server, one per name in `delays`."""
+    from app.scraper import SHOPIFY_SELECTORS
+
+    return {
+        name: dict(SHOPIFY_SELECTORS, name=name.title(), url=f'{base_url}/{name}/search?q={{query}}&delay={delay}')
+        for name, delay in delays.items()
+    }
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        store = url.path.strip('/').split('/')[0]
+        time.sleep(float(params.get('delay', ['0'])[0]))
+        body = render_results_page(store, params.get('q', [''])[0]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, as timed out searches do
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0):
+    """Serve fixture pages on a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    server, base_url = start_server(args.port)
+    print(f'Serving fixture store pages at {base_url}/<store>/search?q=<query>&delay=<seconds>')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
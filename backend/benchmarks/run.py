@@ -0,0 +1,319 @@
+"""
+Benchmark harness for the analysis pipeline, the recommender and the main
+request paths.
+
+Every benchmark reports the median, p95 and operations per second of its
+timed runs. Results are written as JSON and compared with a stored baseline;
+anything whose median got slower than the baseline by more than the threshold
+is reported as a regression and makes the command exit with status 1.
+
+    python -m benchmarks.run                      # run everything, compare to baseline.json
+    python -m benchmarks.run --suite recommender  # run one suite
+    python -m benchmarks.run --save-baseline      # record the current numbers as the baseline
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = 0.20
+
+ANALYSIS_RESOLUTIONS = [(640, 480), (1600, 1200), (4032, 3024)]
+BODY_SHAPES = ['Pear', 'Rectangle', 'Apple', 'Hourglass', 'Inverted Triangle', None]
+RISK_TOLERANCES = ['conservative', 'moderate', 'adventurous', '']
+COLORS = ['navy', 'black', 'olive, beige', 'red', '']
+
+
+def measure(func, repeat, warmup=1):
+    """Time `repeat` calls of `func` after `warmup` untimed ones."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        'median_ms': median * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'ops_per_sec': 1 / median if median else float('inf'),
+        'runs': repeat,
+    }
+
+
+# --- Suites ---
+
+def bench_analysis(repeat):
+    import cv2
+
+    from app.analysis import analyze_image, analyze_skin_tone, detect_face_shape
+    from app.detectors import warm_up
+    from .synthetic import synthetic_face
+
+    warm_up()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for width, height in ANALYSIS_RESOLUTIONS:
+            path = os.path.join(tmp, f'{width}x{height}.jpg')
+            cv2.imwrite(path, synthetic_face(width, height, seed=1)[0])
+            size = f'{width}x{height}'
+            results[f'analysis.detect_face_shape[{size}]'] = measure(lambda: detect_face_shape(path), repeat)
+            results[f'analysis.analyze_skin_tone[{size}]'] = measure(lambda: analyze_skin_tone(path), repeat)
+            results[f'analysis.analyze_image[{size}]'] = measure(lambda: analyze_image(path), repeat)
+    return results
+
+
+class _BenchUser:
+    def __init__(self, id, body_shape, style_guide_data):
+        self.id = id
+        self.body_shape = body_shape
+        self.style_guide_data = style_guide_data
+
+
+def generate_users(count, seed=0):
+    """Users with a random body shape and style guide."""
+    rng = random.Random(seed)
+    users = []
+    for user_id in range(1, count + 1):
+        guide = {
+            'fashion_risk_tolerance': rng.choice(RISK_TOLERANCES),
+            'preferred_colors': rng.choice(COLORS),
+            'budget': rng.choice(['low', 'medium', 'high']),
+        }
+        users.append(_BenchUser(user_id, rng.choice(BODY_SHAPES), json.dumps(guide)))
+    return users
+
+
+def bench_recommender(repeat):
+    import shutil
+
+    from app import recommender
+
+    users = generate_users(1000)
+
+    def build_all():
+        for user in users:
+            recommender.build_recommendations(user)
+
+    def generate_all():
+        for user in users:
+            recommender.generate_recommendations(user)
+
+    def reload_index():
+        os.utime(recommender.DATA_FILE)
+        recommender._index_checked_at = 0.0
+        recommender.get_recommendation_index()
+
+    # reload_index() touches the data file, so work on a copy and leave the
+    # tracked one alone
+    data_file = recommender.DATA_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        recommender.DATA_FILE = shutil.copy(data_file, tmp)
+        recommender._index_checked_at = 0.0
+        try:
+            recommender.get_recommendation_index()
+            return {
+                'recommender.build_recommendations[1000 users]': measure(build_all, repeat),
+                'recommender.generate_recommendations[1000 users, cached]': measure(generate_all, repeat),
+                'recommender.compile_index': measure(reload_index, repeat),
+            }
+        finally:
+            recommender.DATA_FILE = data_file
+            recommender._index_checked_at = 0.0
+
+
+def sql_statements(app, db, request):
+    """The SQL statements `request()` executes."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', collect)
+    try:
+        request()
+    finally:
+        event.remove(engine, 'before_cursor_execute', collect)
+    return statements
+
+
+def bench_http(repeat):
+    import cv2
+
+    from app import create_app, database, db
+    from app.models import User
+    from app.pagecache import clear_page_cache
+    from .synthetic import synthetic_face
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.sqlite'),
+            'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+            'WTF_CSRF_ENABLED': False,
+            'ANALYSIS_WORKERS': 0,
+            'PROFILE_SAMPLE_RATE': 0.0,
+            'PRELOAD_ANALYSIS': True,
+        })
+        database.create_schema(app, db)
+        with app.app_context():
+            user = User(username='bench', email='bench@example.com', body_shape='Pear',
+                        style_guide_data=json.dumps({'fashion_risk_tolerance': 'moderate', 'preferred_colors': 'navy'}))
+            user.set_password('bench-password')
+            db.session.add(user)
+            db.session.commit()
+
+        def login(client):
+            response = client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+            assert response.status_code == 302, response.status_code
+
+        results['http.login'] = measure(lambda: login(app.test_client()), repeat)
+
+        client = app.test_client()
+        login(client)
+
+        def recommendations():
+            assert client.get('/recommendations').status_code == 200
+
+        results['http.recommendations'] = measure(recommendations, repeat)
+
+        def recommendations_uncached():
+            clear_page_cache()
+            recommendations()
+
+        results['http.recommendations[render]'] = measure(recommendations_uncached, repeat)
+        etag = client.get('/recommendations').headers['ETag']
+
+        def recommendations_revalidated():
+            assert client.get('/recommendations', headers={'If-None-Match': etag}).status_code == 304
+
+        results['http.recommendations[304]'] = measure(recommendations_revalidated, repeat)
+
+        def dashboard():
+            assert client.get('/dashboard').status_code == 200
+
+        results['http.dashboard'] = measure(dashboard, repeat)
+
+        # A warm request takes the user from the identity cache; only
+        # cached pages read the content version
+        for path in ('/dashboard', '/wardrobe'):
+            statements = sql_statements(app, db, lambda: client.get(path))
+            user_queries = [statement for statement in statements if re.search(r'\bFROM "?user\b', statement)]
+            assert not user_queries, (path, user_queries)
+
+        uploads = []
+        for seed in range(repeat + 1):
+            ok, encoded = cv2.imencode('.jpg', synthetic_face(1600, 1200, seed=seed)[0])
+            uploads.append(encoded.tobytes())
+        pending = list(uploads)
+
+        def upload(data):
+            import io
+            response = client.post('/analysis', data={'file': (io.BytesIO(data), 'bench.jpg')},
+                                   content_type='multipart/form-data')
+            assert response.status_code == 302, response.status_code
+
+        results['http.analysis[new photo, inline]'] = measure(lambda: upload(pending.pop()), repeat)
+        results['http.analysis[repeat photo, cached]'] = measure(lambda: upload(uploads[0]), repeat)
+
+        thumbnail_url = f'/thumbnails/small/webp/{hashlib.sha256(uploads[0]).hexdigest()}.jpg'
+
+        def thumbnail():
+            assert client.get(thumbnail_url).status_code == 200
+
+        results['http.thumbnail'] = measure(thumbnail, repeat)
+    return results
+
+
+SUITES = {
+    'analysis': bench_analysis,
+    'recommender': bench_recommender,
+    'http': bench_http,
+}
+
+
+# --- Reporting ---
+
+def compare(results, baseline, threshold):
+    """Return (name, baseline_ms, current_ms, change) for every regression."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        if change > threshold:
+            regressions.append((name, before['median_ms'], result['median_ms'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--suite', action='append', choices=sorted(SUITES), help='Suite to run; repeat for several. Default: all.')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per benchmark.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON to compare with.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed slowdown before a regression is flagged, as a fraction.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for suite in args.suite or list(SUITES):
+        print(f'Running {suite} benchmarks...', file=sys.stderr)
+        results.update(SUITES[suite](args.repeat))
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'benchmark':<58} {'median ms':>10} {'p95 ms':>10} {'ops/s':>10} {'vs base':>8}")
+    for name, result in results.items():
+        before = (baseline or {}).get('results', {}).get(name)
+        change = f"{result['median_ms'] / before['median_ms'] - 1:+.0%}" if before and before['median_ms'] else ''
+        print(f"{name:<58} {result['median_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['ops_per_sec']:>10.1f} {change:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    if baseline is None:
+        print('No baseline to compare with; run with --save-baseline to record one.')
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after, change in regressions:
+        print(f'REGRESSION {name}: {before:.2f}ms -> {after:.2f}ms ({change:+.0%})')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
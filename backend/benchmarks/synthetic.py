@@ -0,0 +1,84 @@
+"""Synthetic, face-like test images for the benchmarks."""
+import cv2
+import numpy as np
+
+SKIN_TONES_BGR = [
+    (180, 200, 230),
+    (120, 150, 200),
+    (90, 120, 160),
+    (50, 70, 100),
+]
+
+
+def synthetic_face(width, height, face_fraction=0.6, seed=0, skin=None):
+    """
+    Draw a cartoon face that the frontal face Haar cascade picks up.
+
+    Args:
+        width, height (int): Image size in pixels.
+        face_fraction (float): Face height as a fraction of the image height.
+        seed (int): Seed for the background noise, placement and skin colour.
+        skin (tuple): BGR skin colour; picked from SKIN_TONES_BGR when None.
+
+    Returns:
+        tuple: The BGR image and the (x, y, w, h) bounding box of the face.
+    """
+    rng = np.random.default_rng(seed)
+    skin = skin or SKIN_TONES_BGR[seed % len(SKIN_TONES_BGR)]
+    background = tuple(int(v) for v in rng.integers(150, 230, 3))
+    img = np.empty((height, width, 3), np.uint8)
+    img[:] = background
+    noise = rng.normal(0, 6, (height, width, 1)).astype(np.int16)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+
+    fh = int(height * face_fraction / 2)
+    fw = int(fh * rng.uniform(0.72, 0.82))
+    cx = int(width / 2 + rng.uniform(-0.1, 0.1) * (width - 2 * fw))
+    cy = int(height / 2 + rng.uniform(-0.1, 0.1) * (height - 2 * fh))
+    cv2.ellipse(img, (cx, cy), (fw, fh), 0, 0, 360, skin, -1)
+
+    dark = tuple(max(0, c - 140) for c in skin)
+    eye_y = cy - fh // 4
+    for dx in (-fw // 2.4, fw // 2.4):
+        ex = int(cx + dx)
+        cv2.ellipse(img, (ex, eye_y), (fw // 5, fh // 12), 0, 0, 360, dark, -1)
+        brow = eye_y - fh // 6
+        cv2.line(img, (ex - fw // 5, brow), (ex + fw // 5, brow), dark, max(2, fh // 25))
+    cv2.line(img, (cx, eye_y), (cx, cy + fh // 6), tuple(max(0, c - 20) for c in skin), max(2, fw // 15))
+    cv2.ellipse(img, (cx, cy + fh // 2), (fw // 3, fh // 14), 0, 0, 360, (60, 60, 140), -1)
+
+    img = cv2.GaussianBlur(img, (0, 0), max(1.0, width / 300))
+    return img, (cx - fw, cy - fh, 2 * fw, 2 * fh)
+
+
+def write_synthetic_face(path, width, height, **kwargs):
+    """Write a synthetic face to `path` and return its bounding box."""
+    img, box = synthetic_face(width, height, **kwargs)
+    cv2.imwrite(path, img)
+    return box
+
+
+def synthetic_palette_image(width, height, colors, seed=0):
+    """
+    Fill an image with blocks of known colours in known proportions.
+
+    Args:
+        width, height (int): Image size in pixels.
+        colors (list): (bgr, share) pairs; the shares should add up to 1.
+        seed (int): Seed for the block order and pixel noise.
+
+    Returns:
+        numpy.ndarray: The BGR image.
+    """
+    rng = np.random.default_rng(seed)
+    cells = 64
+    assignment = np.concatenate([
+        np.full(int(round(share * cells * cells)), i) for i, (_, share) in enumerate(colors)
+    ])[:cells * cells]
+    assignment = np.pad(assignment, (0, cells * cells - len(assignment)), mode='edge')
+    rng.shuffle(assignment)
+    palette = np.array([bgr for bgr, _ in colors], np.int16)
+    grid = palette[assignment.reshape(cells, cells)]
+    img = cv2.resize(grid.astype(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST)
+    noise = rng.normal(0, 4, img.shape).astype(np.int16)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)